@@ -0,0 +1,104 @@
+"""
+Replays price history through the trading logic as fast as possible, no display needed
+"""
+
+import math
+from array import array
+from engine import TradeEngine, TRADERISKPIPS, TRADERISKPERCENT
+from enums import TradeMode
+
+
+class Backtest(TradeEngine):
+    """
+    Steps a TradeEngine through the candles the same way the arrow keys do in the app
+    """
+    def __init__(self, ask=None, bid=None, risk_pips=TRADERISKPIPS, risk_percent=TRADERISKPERCENT):
+        super().__init__(ask, bid, risk_pips, risk_percent)
+        self.equity_curve = [self.trade_state.equity]
+
+    def close(self, trade_type, close_price=None):
+        record = super().close(trade_type, close_price)
+        if record is not None:
+            self.equity_curve.append(self.trade_state.equity)
+        return record
+
+    def run(self, strategy, first_candle=0, last_candle=None):
+        """
+        Moves to each candle first_candle..last_candle, checks the stop, then calls strategy(self).
+        The strategy trades with buy, sell and close like the keyboard does, stops are checked
+        again straight after in case a new position is stopped on its entry candle
+        """
+        if last_candle is None:
+            last_candle = len(self.bid) - 1
+        for candle in range(first_candle, last_candle + 1):
+            self.last_candle = candle
+            self.check_orders()
+            strategy(self)
+            self.check_orders()
+        return self
+
+
+def signal_strategy(signals):
+    """
+    Strategy for Backtest.run from a list of (candle, TradeMode, TradeType) entries.
+    TradeMode.CLOSED closes the open position
+    """
+    signals_by_candle = dict()
+    for candle, trade_mode, trade_type in signals:
+        signals_by_candle.setdefault(candle, list()).append((trade_mode, trade_type))
+
+    def strategy(engine):
+        for trade_mode, trade_type in signals_by_candle.get(engine.last_candle, ()):
+            if trade_mode == TradeMode.BUY:
+                engine.buy(trade_type)
+            elif trade_mode == TradeMode.SELL:
+                engine.sell(trade_type)
+            else:
+                engine.close(trade_type)
+    return strategy
+
+def run_backtest(ask, bid, strategy, risk_pips=TRADERISKPIPS, risk_percent=TRADERISKPERCENT, first_candle=0, last_candle=None):
+    """
+    Runs strategy (a callback or a list of signals) over the series and returns the finished Backtest.
+    Results are in its history, stats.trend/stats.fade and trade_state.equity
+    """
+    if not callable(strategy):
+        strategy = signal_strategy(strategy)
+    backtest = Backtest(ask, bid, risk_pips, risk_percent)
+    return backtest.run(strategy, first_candle, last_candle)
+
+def resolve_stops(ask, bid, entries, directions, stop_pips=TRADERISKPIPS):
+    """
+    Finds where the stop of every trade is hit without stepping through the candles.
+    A trade i is entered at the close of candle entries[i] in directions[i] (TradeMode.BUY/SELL)
+    with its stop stop_pips (a number, or one per trade) away, priced like buy/sell.
+    Returns arrays of the exit candle, exit (stop) price and the pips check_orders records for it,
+    -1/nan where the stop is never hit. Each lookup is a range tree search over the bid lows
+    (buys) or ask highs (sells), so it doesn't depend on how long the trade lasts
+    """
+    if isinstance(stop_pips, (int, float)):
+        stop_pips = [stop_pips] * len(entries)
+    low_tree = bid.low_tree
+    high_tree = ask.high_tree
+    exit_candles = array('q')
+    exit_prices = array('d')
+    pips = array('d')
+    for entry, direction, stop in zip(entries, directions, stop_pips):
+        if direction == TradeMode.BUY or direction == TradeMode.BUY.value:
+            order_price = ask.close[entry]
+            stop_loss_price = order_price - stop * 0.0001
+            exit_candle = low_tree.first_reaching(entry, stop_loss_price)
+            exit_pips = 1 + (bid.close[exit_candle] - order_price) * 10000
+        else:
+            order_price = bid.close[entry]
+            stop_loss_price = order_price + stop * 0.0001
+            exit_candle = high_tree.first_reaching(entry, stop_loss_price)
+            exit_pips = 1 + (order_price - ask.close[exit_candle]) * 10000
+        exit_candles.append(exit_candle)
+        if exit_candle < 0:
+            exit_prices.append(math.nan)
+            pips.append(math.nan)
+        else:
+            exit_prices.append(stop_loss_price)
+            pips.append(exit_pips)
+    return exit_candles, exit_prices, pips
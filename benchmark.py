@@ -0,0 +1,343 @@
+"""
+Times loading, chart drawing, scrolling and trade replay on generated data, headless,
+and writes the results as JSON with an optional comparison against an earlier run
+"""
+
+import os
+#Headless, must be set before pygame is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import math
+import platform
+import random
+import shutil
+import sys
+import time
+import pygame
+from backtest import Backtest
+from enums import TradeMode, TradeType
+from resample import load_tick_timeframes
+from series import CACHE_SUFFIX
+from main import Trading
+
+try:
+    import resource
+except ImportError:
+    #Not available on Windows, memory isn't reported there
+    resource = None
+
+
+SIZES = {'10k': 10000, '1m': 1000000, '100m': 100000000}
+ZOOM_KEYS = (pygame.K_1, pygame.K_2, pygame.K_3, pygame.K_4)
+DRAW_REPEATS = 20
+LOAD_REPEATS = 5
+REPLAY_REPEATS = 3
+#Results with fewer samples than this are reported but left out of the --max-regression check
+MIN_COMPARE_SAMPLES = 3
+SCROLL_SCRIPT = ((pygame.K_RIGHT, 200), (pygame.K_PAGEUP, 50), (pygame.K_LEFT, 200), (pygame.K_PAGEDOWN, 50))
+#Candles between entries and the candles a trade is held for in the replay
+REPLAY_ENTRY_CANDLES = 10
+REPLAY_HOLD_CANDLES = 5
+
+
+def generate_candles(ask_file, bid_file, rows, seed=1, spread=0.0001):
+    """
+    Writes matching ASK and BID candle files (Time,Open,High,Low,Close,Volume) from a random walk
+    """
+    generator = random.Random(seed)
+    gauss = generator.gauss
+    #Hourly candles unless that would run past year 9999
+    step = 3600 if rows < 50000000 else 60
+    seconds = (datetime.date(2000, 1, 1).toordinal() - datetime.date(1970, 1, 1).toordinal()) * 86400
+    price = 1.3
+    with open(ask_file, 'w') as ask_data, open(bid_file, 'w') as bid_data:
+        for _ in range(rows):
+            open_price = price
+            close_price = max(price + gauss(0, 0.002), 0.1)
+            high_price = max(open_price, close_price) + abs(gauss(0, 0.001))
+            low_price = max(min(open_price, close_price) - abs(gauss(0, 0.001)), 0.05)
+            volume = generator.random() * 1000
+            time_text = time.strftime('%d.%m.%Y %H:%M:%S.000', time.gmtime(seconds))
+            bid_data.write("%s,%.5f,%.5f,%.5f,%.5f,%.2f\n" % (time_text, open_price, high_price, low_price, close_price, volume))
+            ask_data.write("%s,%.5f,%.5f,%.5f,%.5f,%.2f\n" % (time_text, open_price + spread, high_price + spread,
+                                                             low_price + spread, close_price + spread, volume))
+            price = close_price
+            seconds += step
+
+def generate_ticks(tick_file, rows, seed=2, spread=0.0001):
+    """
+    Writes a tick file (Time,Ask,Bid,AskVolume,BidVolume with the date and time in separate columns)
+    """
+    generator = random.Random(seed)
+    gauss = generator.gauss
+    milliseconds = (datetime.date(2000, 1, 1).toordinal() - datetime.date(1970, 1, 1).toordinal()) * 86400000
+    price = 1.3
+    with open(tick_file, 'w') as tick_data:
+        for _ in range(rows):
+            price = max(price + gauss(0, 0.00005), 0.1)
+            seconds, millisecond = divmod(milliseconds, 1000)
+            tick_data.write("%s.%03d,%.5f,%.5f,0.74,0.74\n" % (time.strftime('%Y.%m.%d,%H:%M:%S', time.gmtime(seconds)),
+                                                              millisecond, price + spread, price))
+            milliseconds += generator.randint(50, 3000)
+
+def prepare_data(work_dir, size_name, rows):
+    """
+    Generates the data directories for one size unless they already exist.
+    Returns (candle directory, tick directory), each containing a data folder
+    """
+    candle_dir = os.path.join(work_dir, size_name, 'candles')
+    tick_dir = os.path.join(work_dir, size_name, 'ticks')
+    for directory in (candle_dir, tick_dir):
+        os.makedirs(os.path.join(directory, 'data'), exist_ok=True)
+    ask_file = os.path.join(candle_dir, 'data', 'BENCH_Candlestick_1_Hour_ASK_hourly.csv')
+    bid_file = os.path.join(candle_dir, 'data', 'BENCH_Candlestick_1_Hour_BID_hourly.csv')
+    tick_file = os.path.join(tick_dir, 'data', 'BENCH_tick.csv')
+    if not (os.path.exists(ask_file) and os.path.exists(bid_file)):
+        generate_candles(ask_file, bid_file, rows)
+    if not os.path.exists(tick_file):
+        generate_ticks(tick_file, rows)
+    return candle_dir, tick_dir
+
+def remove_caches(directory):
+    for cache_file in glob.glob(os.path.join(directory, 'data', '*' + CACHE_SUFFIX)):
+        os.remove(cache_file)
+
+def memory():
+    """
+    (current, peak) resident memory of the process in MB, None where it can't be read
+    """
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as statm:
+            current = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        #Bytes on macOS, kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1048576 if sys.platform == 'darwin' else 1024)
+    return current, peak
+
+def timing_result(samples, operations=None, unit=None):
+    """
+    Result for a list of sample durations, seconds is the median.
+    operations (rows, candles...) per sample gives a throughput in unit per second
+    """
+    ordered = sorted(samples)
+    result = {
+        'seconds': ordered[len(ordered) // 2],
+        'mean_seconds': sum(ordered) / len(ordered),
+        'p95_seconds': ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)],
+        'samples': len(ordered),
+    }
+    if operations:
+        result[unit + '_per_second'] = operations / result['seconds'] if result['seconds'] else None
+    result['rss_mb'], result['peak_rss_mb'] = memory()
+    return result
+
+@contextlib.contextmanager
+def working_directory(directory):
+    previous = os.getcwd()
+    os.chdir(directory)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def press(app, key):
+    pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=key))
+    app.do_events()
+
+def load_app_data(app):
+    app.load_data()
+    app.loader.join()
+    app.poll_loader()
+    if app.loader.error:
+        raise RuntimeError(app.loader.error)
+
+def bench_load_data(app, rows):
+    cold = list()
+    for _ in range(LOAD_REPEATS):
+        remove_caches('.')
+        start = time.perf_counter()
+        load_app_data(app)
+        cold.append(time.perf_counter() - start)
+    warm = list()
+    for _ in range(LOAD_REPEATS):
+        start = time.perf_counter()
+        load_app_data(app)
+        warm.append(time.perf_counter() - start)
+    return {'load_data_cold': timing_result(cold, rows * 2, 'rows'),
+            'load_data_warm': timing_result(warm, rows * 2, 'rows')}
+
+def bench_draw_chart(app):
+    """
+    draw_chart at each zoom with the cached surfaces thrown away first (full) and kept (cached)
+    """
+    results = dict()
+    for zoom, key in enumerate(ZOOM_KEYS, 1):
+        press(app, key)
+        app.last_candle = len(app.bid) - 1
+        full = list()
+        for _ in range(DRAW_REPEATS):
+            app.price_lines_key = None
+            app.candle_surface_key = None
+            start = time.perf_counter()
+            app.draw_chart()
+            full.append(time.perf_counter() - start)
+        cached = list()
+        for _ in range(DRAW_REPEATS):
+            start = time.perf_counter()
+            app.draw_chart()
+            cached.append(time.perf_counter() - start)
+        results['draw_chart_zoom{0}_full'.format(zoom)] = timing_result(full, app.max_candles, 'candles')
+        results['draw_chart_zoom{0}_cached'.format(zoom)] = timing_result(cached, app.max_candles, 'candles')
+    press(app, pygame.K_1)
+    return results
+
+def bench_scroll(app):
+    """
+    Key presses through do_events, each followed by the frame the main loop would draw
+    """
+    app.last_candle = max(len(app.bid) - 1 - sum(count for _, count in SCROLL_SCRIPT), app.max_candles)
+    app.drawn_state = None
+    frames = list()
+    for key, count in SCROLL_SCRIPT:
+        for _ in range(count):
+            start = time.perf_counter()
+            press(app, key)
+            app.check_orders()
+            state = app.view_state()
+            if state != app.drawn_state:
+                app.draw_frame(state)
+            frames.append(time.perf_counter() - start)
+    result = timing_result(frames, 1, 'frames')
+    result['total_seconds'] = sum(frames)
+    return {'scroll_session': result}
+
+def replay_strategy(engine):
+    candle = engine.last_candle
+    if engine.trade_state.trade_mode == TradeMode.CLOSED:
+        if candle % REPLAY_ENTRY_CANDLES == 0:
+            if candle // REPLAY_ENTRY_CANDLES % 2:
+                engine.buy(TradeType.TREND)
+            else:
+                engine.sell(TradeType.FADE)
+    elif candle - engine.trade_state.candle_number >= REPLAY_HOLD_CANDLES:
+        engine.close(engine.trade_state.trade_type)
+
+def bench_replay(ask, bid):
+    """
+    check_orders and close over every candle with a fixed entry and exit schedule
+    """
+    samples = list()
+    for _ in range(REPLAY_REPEATS):
+        backtest = Backtest(ask, bid)
+        start = time.perf_counter()
+        backtest.run(replay_strategy)
+        samples.append(time.perf_counter() - start)
+    result = timing_result(samples, len(bid), 'candles')
+    result['trades'] = len(backtest.history)
+    result['trades_per_second'] = len(backtest.history) / result['seconds'] if result['seconds'] else None
+    return {'replay': result}
+
+def bench_ticks(rows):
+    tick_file = os.path.join('data', 'BENCH_tick.csv')
+    cold = list()
+    for _ in range(LOAD_REPEATS):
+        remove_caches('.')
+        start = time.perf_counter()
+        load_tick_timeframes(tick_file)
+        cold.append(time.perf_counter() - start)
+    warm = list()
+    for _ in range(LOAD_REPEATS):
+        start = time.perf_counter()
+        load_tick_timeframes(tick_file)
+        warm.append(time.perf_counter() - start)
+    return {'load_ticks_cold': timing_result(cold, rows, 'rows'),
+            'load_ticks_warm': timing_result(warm, rows, 'rows')}
+
+def run_benchmarks(work_dir, sizes):
+    """
+    {"<size>/<benchmark>": result} for each size name in sizes
+    """
+    results = dict()
+    for size_name in sizes:
+        rows = SIZES[size_name]
+        print("Preparing", size_name, file=sys.stderr)
+        candle_dir, tick_dir = prepare_data(work_dir, size_name, rows)
+        size_results = dict()
+        with working_directory(candle_dir):
+            #Start from no saved position or trades every time
+            shutil.rmtree('settings', ignore_errors=True)
+            app = Trading()
+            app.loader.join()
+            print("Timing", size_name, "candles", file=sys.stderr)
+            size_results.update(bench_load_data(app, rows))
+            size_results.update(bench_draw_chart(app))
+            size_results.update(bench_scroll(app))
+            size_results.update(bench_replay(app.ask, app.bid))
+            del app
+        with working_directory(tick_dir):
+            print("Timing", size_name, "ticks", file=sys.stderr)
+            size_results.update(bench_ticks(rows))
+        for name, result in size_results.items():
+            results[size_name + '/' + name] = result
+    return results
+
+def compare(results, baseline):
+    """
+    Change in seconds against the baseline results for the benchmarks in both,
+    a positive change_percent is slower. gated is False where either run has too few samples to trust
+    """
+    comparison = dict()
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous and previous.get('seconds') and result.get('seconds') is not None:
+            comparison[name] = {
+                'baseline_seconds': previous['seconds'],
+                'seconds': result['seconds'],
+                'change_percent': (result['seconds'] / previous['seconds'] - 1) * 100,
+                'gated': min(result.get('samples', 1), previous.get('samples', 1)) >= MIN_COMPARE_SAMPLES,
+            }
+    return comparison
+
+def environment():
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=['10k', '1m'],
+                        help="rows of generated data, 100m needs tens of GB of disk and memory")
+    parser.add_argument('--work-dir', default='benchmark_data', help="generated data, reused by later runs")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--baseline', default=None, help="results of an earlier run to compare with")
+    parser.add_argument('--max-regression', type=float, default=None, metavar='PERCENT',
+                        help="exit with status 1 if a benchmark is this much slower than the baseline")
+    args = parser.parse_args()
+    report = {'environment': environment(), 'results': run_benchmarks(os.path.abspath(args.work_dir), args.sizes)}
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['baseline'] = args.baseline
+            report['comparison'] = compare(report['results'], json.load(baseline_file)['results'])
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    for name, result in report['results'].items():
+        change = report.get('comparison', dict()).get(name)
+        print("{0:<36}{1:>12.6f}s{2}".format(name, result['seconds'],
+                                              "" if change is None else "{0:>+9.1f}%".format(change['change_percent'])))
+    print("Wrote", args.output)
+    if args.max_regression is not None and any(change['gated'] and change['change_percent'] > args.max_regression
+                                                for change in report.get('comparison', dict()).values()):
+        sys.exit(1)
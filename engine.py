@@ -0,0 +1,96 @@
+"""
+Trading logic shared by the app and the backtester, no display needed
+"""
+
+from enums import TradeMode, TradeState, Stats
+from history import TradeHistory
+
+
+TRADERISKPERCENT = 0.01
+TRADERISKPIPS = 80
+
+class TradeEngine():
+    """
+    Opens, tracks and closes a single position on the ask/bid series at last_candle
+    """
+    def __init__(self, ask=None, bid=None, risk_pips=TRADERISKPIPS, risk_percent=TRADERISKPERCENT):
+        self.ask = ask
+        self.bid = bid if bid is not None else ask
+        self.risk_pips = risk_pips
+        self.risk_percent = risk_percent
+        self.last_candle = 0
+        self.trade_state = TradeState()
+        self.stats = Stats()
+        self.history = TradeHistory()
+
+    def record_candle(self, candle):
+        """
+        Candle number as stored in the history
+        """
+        return candle
+
+    def entry_record_candle(self):
+        """
+        The open position's entry candle as stored in the history
+        """
+        return self.record_candle(self.trade_state.candle_number)
+
+    def current_record_candle(self):
+        """
+        The current candle as stored in the history
+        """
+        return self.record_candle(self.last_candle)
+
+    def check_orders(self):
+        if (self.trade_state.trade_mode == TradeMode.BUY):
+            self.trade_state.pips = 1 + (self.bid.close[self.last_candle] - self.trade_state.order_price) * 10000
+            self.trade_state.profit = self.trade_state.pips * self.trade_state.position_size * 100
+            if self.bid.low[self.last_candle] <= self.trade_state.stop_loss_price:
+                self.close(self.trade_state.trade_type, self.trade_state.stop_loss_price)
+
+        if (self.trade_state.trade_mode == TradeMode.SELL):
+            self.trade_state.pips = 1 + (self.trade_state.order_price - self.ask.close[self.last_candle]) * 10000
+            self.trade_state.profit = self.trade_state.pips * self.trade_state.position_size * 100
+            if self.ask.high[self.last_candle] >= self.trade_state.stop_loss_price:
+                self.close(self.trade_state.trade_type, self.trade_state.stop_loss_price)
+
+    def buy(self, trade_type):
+        if self.trade_state.trade_mode == TradeMode.CLOSED:
+            self.trade_state.trade_mode = TradeMode.BUY
+            self.trade_state.order_price = self.ask.close[self.last_candle]
+            self.trade_state.stop_loss_price = self.trade_state.order_price - self.risk_pips * 0.0001
+            self.trade_state.position_size = self.trade_state.equity * self.risk_percent / self.risk_pips * 0.01
+            self.trade_state.candle_number = self.last_candle
+            self.trade_state.trade_type = trade_type
+
+    def sell(self, trade_type):
+        if self.trade_state.trade_mode == TradeMode.CLOSED:
+            self.trade_state.trade_mode = TradeMode.SELL
+            self.trade_state.order_price = self.bid.close[self.last_candle]
+            self.trade_state.stop_loss_price = self.trade_state.order_price + self.risk_pips * 0.0001
+            self.trade_state.position_size = self.trade_state.equity * self.risk_percent / self.risk_pips * 0.01
+            self.trade_state.candle_number = self.last_candle
+            self.trade_state.trade_type = trade_type
+
+    def close(self, trade_type, close_price=None):
+        """
+        Closes the open position and returns its history record, None if there was nothing to close
+        """
+        if self.trade_state.trade_mode != TradeMode.CLOSED:
+            record = (
+                self.entry_record_candle(),
+                self.trade_state.order_price,
+                self.current_record_candle(),
+                close_price or self.ask.close[self.last_candle],
+                self.trade_state.trade_mode.value
+            )
+            self.history.append(*record)
+            self.trade_state.trade_mode = TradeMode.CLOSED
+            self.trade_state.equity += self.trade_state.profit
+            self.stats.add(trade_type, self.trade_state.pips)
+            self.trade_state.profit = 0
+            self.trade_state.order_price = 0
+            self.trade_state.position_size = 0
+            self.trade_state.stop_loss_price = 0
+            self.trade_state.pips = 0
+            return record
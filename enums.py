@@ -1,4 +1,5 @@
 from enum import Enum
+from tradestats import RunningStats
 
 
 class TradeMode(Enum):
@@ -26,8 +27,19 @@ class TradeState:
 
 class Stats:
     """Tracks the different types of trade pip wins and losses for statistical analysis"""
-    trend = []
-    fade = []
+    def __init__(self):
+        self.trend = []
+        self.fade = []
+        self.running = {TradeType.TREND: RunningStats(), TradeType.FADE: RunningStats()}
+
+    def add(self, trade_type, pips):
+        """Records the pips of a closed trade and updates its running statistics"""
+        pips = float(pips)
+        if trade_type == TradeType.FADE:
+            self.fade.append(pips)
+        else:
+            self.trend.append(pips)
+        self.running[TradeType.FADE if trade_type == TradeType.FADE else TradeType.TREND].add(pips)
 
 class OHLC(Enum):
     """Enum for picking Open High Low Close data from the bid and ask lists"""
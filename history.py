@@ -0,0 +1,54 @@
+"""
+Closed trade records kept as typed columns sorted by close candle
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class TradeHistory:
+    """
+    Parallel arrays of (open candle, order price, close candle, close price, trade mode value).
+    Records are kept in close candle order so the trades closed inside a candle range can be found with a bisect
+    """
+    def __init__(self):
+        self.open_candle = array('q')
+        self.order_price = array('d')
+        self.close_candle = array('q')
+        self.close_price = array('d')
+        self.trade_mode = array('b')
+
+    def __len__(self):
+        return len(self.close_candle)
+
+    def __getitem__(self, index):
+        return (self.open_candle[index], self.order_price[index], self.close_candle[index],
+                self.close_price[index], self.trade_mode[index])
+
+    def __iter__(self):
+        return zip(self.open_candle, self.order_price, self.close_candle, self.close_price, self.trade_mode)
+
+    def append(self, open_candle, order_price, close_candle, close_price, trade_mode):
+        if len(self) == 0 or close_candle >= self.close_candle[-1]:
+            self.open_candle.append(open_candle)
+            self.order_price.append(order_price)
+            self.close_candle.append(close_candle)
+            self.close_price.append(close_price)
+            self.trade_mode.append(trade_mode)
+        else:
+            #Closed before a later trade, eg after scrolling back
+            index = bisect_right(self.close_candle, close_candle)
+            self.open_candle.insert(index, open_candle)
+            self.order_price.insert(index, order_price)
+            self.close_candle.insert(index, close_candle)
+            self.close_price.insert(index, close_price)
+            self.trade_mode.insert(index, trade_mode)
+
+    def closed_between(self, first_candle, last_candle):
+        """
+        Records of the trades closed on candles first_candle..last_candle (inclusive)
+        """
+        first = bisect_left(self.close_candle, first_candle)
+        last = bisect_right(self.close_candle, last_candle)
+        for index in range(first, last):
+            yield self[index]
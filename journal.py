@@ -0,0 +1,68 @@
+"""
+Append only journal of closed trades, so trades are saved as they happen instead of on exit
+"""
+
+import os
+import time
+import struct
+
+
+#sequence, open candle, order price, close candle, close price, trade mode, trade type, pips, equity after the trade
+RECORD = struct.Struct('<qqdqdbbdd')
+SYNCSECONDS = 2.0
+#Records kept before the app writes them into its snapshot files and empties the journal
+COMPACTRECORDS = 1000
+
+
+class TradeJournal:
+    """
+    Fixed size trade records appended to a file.
+    Writes are buffered and flushed to disk (fsync) at most every SYNCSECONDS
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = None
+        self.pending = False
+        self.last_sync = time.monotonic()
+
+    def read(self):
+        """
+        All complete records in the journal, a record torn by a crash is ignored
+        """
+        if not os.path.exists(self.filename):
+            return []
+        with open(self.filename, 'rb') as journal_file:
+            data = journal_file.read()
+        return list(RECORD.iter_unpack(data[:len(data) - len(data) % RECORD.size]))
+
+    def append(self, sequence, open_candle, order_price, close_candle, close_price, trade_mode, trade_type, pips, equity):
+        if self.file is None:
+            self.file = open(self.filename, 'ab')
+        self.file.write(RECORD.pack(sequence, open_candle, order_price, close_candle, close_price, trade_mode, trade_type, pips, equity))
+        self.pending = True
+        self.sync_if_due()
+
+    def sync_if_due(self):
+        if self.pending and time.monotonic() - self.last_sync >= SYNCSECONDS:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.pending:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.pending = False
+        self.last_sync = time.monotonic()
+
+    def clear(self):
+        """
+        Empties the journal once its records are in a snapshot
+        """
+        self.close()
+        with open(self.filename, 'wb'):
+            pass
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
@@ -0,0 +1,156 @@
+"""
+Finds and loads the data files in the data directory
+"""
+
+import glob
+import os
+import re
+import threading
+from series import PriceSeries, load_series_steps, containing_candles, CACHE_SUFFIX
+from resample import load_tick_timeframes, TIMEFRAMES
+
+
+#Timeframe name and the text that identifies its candle files
+FILE_TIMEFRAMES = (('1h', 'hourly'), ('4h', '4 hours'), ('daily', 'daily'))
+
+
+def list_data_files(data_dir):
+    return sorted(filename for filename in glob.glob(os.path.join('.', data_dir, "*"))
+                  if not filename.endswith((CACHE_SUFFIX, CACHE_SUFFIX + '.tmp')))
+
+def get_filenames(file_list, file_search):
+    #The search text has to start a word so eg "tick" doesn't match "Candlestick"
+    pattern = re.compile(r'(?<![a-z])' + re.escape(file_search))
+    return [filename for filename in file_list if pattern.search(os.path.basename(filename).lower())]
+
+def get_filename(file_list, file_search):
+    for filename in get_filenames(file_list, file_search):
+        return filename
+
+def load_timeframes(data_dir, names=None):
+    """
+    Returns {timeframe name: (ask series, bid series)} ordered from shortest to longest timeframe,
+    limited to names if given. Candle files are used where there is one for the timeframe,
+    the rest are resampled from the tick file
+    """
+    loader = DataLoader(data_dir, names)
+    loader.load()
+    return {name: loader.timeframes[name] for name, _ in TIMEFRAMES if name in loader.timeframes}
+
+
+class DataLoader(threading.Thread):
+    """
+    Loads the data directory on a background thread, base timeframe first.
+    base holds the base timeframe's (ask, bid) series while they are still being parsed or resampled,
+    timeframes only gets a timeframe once it is completely loaded and the base timeframe is too.
+    index_maps holds containing_candles between each timeframe and the base one, keyed by (source, target)
+    """
+    def __init__(self, data_dir, names=None):
+        super().__init__(daemon=True)
+        self.data_dir = data_dir
+        self.names = names
+        self.base_timeframe = None
+        self.base = None
+        self.timeframes = dict()
+        self.index_maps = dict()
+        #Completely loaded timeframes, published once the base timeframe is loaded
+        self.loaded = dict()
+        self.status = "Loading data"
+        self.progress = 0.0
+        self.error = None
+        self.finished = False
+
+    def run(self):
+        try:
+            self.load()
+        except Exception as error:
+            self.error = str(error)
+        finally:
+            self.finished = True
+
+    def report(self, progress):
+        self.progress = progress
+
+    def load(self):
+        filenames = list_data_files(self.data_dir)
+        candle_files = dict()
+        for name, file_search in FILE_TIMEFRAMES:
+            files = get_filenames(filenames, file_search)
+            if files and (self.names is None or name in self.names):
+                candle_files[name] = files
+        tick_file = get_filename(filenames, 'tick')
+        wanted = [name for name, _ in TIMEFRAMES if self.names is None or name in self.names]
+        if '1h' in wanted and (tick_file or '1h' in candle_files):
+            self.base_timeframe = '1h'
+        elif candle_files:
+            self.base_timeframe = next(iter(candle_files))
+        elif tick_file and wanted:
+            self.base_timeframe = wanted[0]
+        else:
+            self.error = "No data files found in " + self.data_dir
+            return
+        for name in sorted(candle_files, key=lambda name: name != self.base_timeframe):
+            self.status = "Loading " + name
+            self.progress = 0.0
+            #ASK file first, optional BID file second
+            files = candle_files[name][:2]
+            series = [PriceSeries() for _ in files]
+            for prices in series:
+                prices.complete = False
+            steps = [load_series_steps(filename, prices) for filename, prices in zip(files, series)]
+            fractions = [0.0 for _ in files]
+            while any(step is not None for step in steps):
+                #A chunk of each file in turn, so both reach the saved position together
+                for index, step in enumerate(steps):
+                    if step is None:
+                        continue
+                    try:
+                        fractions[index] = next(step)
+                    except StopIteration as finished:
+                        series[index] = finished.value
+                        fractions[index] = 1.0
+                        steps[index] = None
+                        #The cache may have replaced the placeholder
+                        if name == self.base_timeframe:
+                            self.base = (series[0], series[-1])
+                    if name == self.base_timeframe and self.base is None:
+                        self.base = (series[0], series[-1])
+                self.progress = sum(fractions) / len(fractions)
+            self.publish(name, (series[0], series[-1]))
+        if tick_file and any(name not in self.loaded for name in wanted):
+            self.status = "Resampling ticks"
+            self.progress = 0.0
+            growing = dict()
+            if self.base is None:
+                #The base timeframe's bars can be shown while the rest of the tick file is resampled
+                growing[self.base_timeframe] = (PriceSeries(), PriceSeries())
+                for prices in growing[self.base_timeframe]:
+                    prices.complete = False
+                self.base = growing[self.base_timeframe]
+            for name, series in load_tick_timeframes(tick_file, progress=self.report, series=growing).items():
+                if name in wanted and name not in self.loaded:
+                    self.publish(name, series)
+        self.status = "Loaded"
+        self.progress = 1.0
+
+    def publish(self, name, series):
+        """
+        Makes a completely loaded timeframe available, after building its range query trees
+        and its candle maps to and from the base timeframe
+        """
+        self.status = "Indexing " + name
+        for prices in set(series):
+            prices.build_trees()
+        self.loaded[name] = series
+        if name == self.base_timeframe:
+            self.base = series
+        if self.base_timeframe not in self.loaded:
+            return
+        base_times = self.loaded[self.base_timeframe][1].time
+        for other, other_series in self.loaded.items():
+            if other in self.timeframes:
+                continue
+            if other != self.base_timeframe:
+                self.index_maps[(self.base_timeframe, other)] = containing_candles(base_times, other_series[1].time)
+                self.index_maps[(other, self.base_timeframe)] = containing_candles(other_series[1].time, base_times)
+            self.timeframes[other] = other_series
@@ -3,20 +3,36 @@
 App for testing out trading ideas
 """
 
+import argparse
 import datetime
+import functools
 import sys
 import os
-import glob
 import math
 import pygame
 from pygame.locals import *
-from enums import TradeMode, TradeType, TradeState, Stats, OHLC
+from enums import TradeMode, TradeType
+from engine import TradeEngine
+from loader import DataLoader
+from resample import TIMEFRAMES
+from journal import TradeJournal, COMPACTRECORDS
+from profiler import FrameProfiler
 
 
 CHARTTOPYOFFSET = 150
 CHARTRIGHTSPACING = 60
-TRADERISKPERCENT = 0.01
-TRADERISKPIPS = 80
+MAXFPS = 60
+#Frames between refreshes of the frame timings overlay
+PROFILEREFRESHFRAMES = 30
+#Rendered text surfaces kept for reuse
+TEXTCACHESIZE = 512
+HELPLINES = (
+    "Move 1 candle: use left and right arrow.",
+    "Move multiple candles: use PageUp and PageDown.",
+    "Buy/Sell. Tracked as Fade Trade: b/s.",
+    "Buy/Sell. Tracked as Trend Trade: n/d.",
+    "Change Zoom: 1-5. Change Timeframe: , and .",
+    "Frame Timings: F2. Exit: Escape.")
     
 def draw_horizontal_dashed_line(surf, colour, start_pos, end_pos, width=1, dash_length=10):
     length = end_pos[0] - start_pos[0]
@@ -26,11 +42,19 @@ def draw_horizontal_dashed_line(surf, colour, start_pos, end_pos, width=1, dash_
         end   = start_pos[0] + ((index + 1) * dash_length)
         pygame.draw.line(surf, colour, (start, y_value), (end, y_value), width)
 
-class Trading():
+@functools.lru_cache(maxsize=TEXTCACHESIZE)
+def render_text(font, text, colour):
+    """
+    Antialiased text surface, cached so text that is the same as in an earlier frame isn't rasterised again
+    """
+    return font.render(text, 1, colour)
+
+class Trading(TradeEngine):
     """
     Trading Practice App
     """
-    def __init__(self):
+    def __init__(self, profile_file=None):
+        super().__init__()
         self.data_dir = 'data'
         if not os.path.exists(self.data_dir):
             os.mkdir(self.data_dir)
@@ -41,221 +65,474 @@ class Trading():
         self.fade_file = os.path.join(self.settings_dir, 'fade.txt')
         self.trend_file = os.path.join(self.settings_dir, 'trend.txt')
         self.history_file = os.path.join(self.settings_dir, 'history.txt')
+        self.journal = TradeJournal(os.path.join(self.settings_dir, 'journal.bin'))
+        self.journal_sequence = 0
+        self.journal_records = 0
+        #Base timeframe candle the open position was entered on
+        self.entry_base_candle = 0
         self.done = False
         self.bull_candle_colour = (20, 255, 20)
         self.bear_candle_colour = (255, 20, 20)
         self.doji_candle_colour = (125, 125, 125)
         self.order_colour = (20, 255, 20)
         self.stop_loss_colour = (255, 20, 20)
+        self.background_colour = (45, 45, 45)
         self.max_candles = 450
         self.last_candle = self.max_candles
         self.candle_width = 3
         self.candle_spacing = 1
         self.chart_pip_height = 800
-        self.load_data()
+        self.candles_per_pixel = 1
         pygame.init()
         self.screen = pygame.display.set_mode(size=(1920, 1080), flags=pygame.DOUBLEBUF | pygame.HWSURFACE | pygame.RESIZABLE, depth=32, display=0)
         pygame.display.set_caption("Trading Practice App")
         pygame.font.init()
         self.font = pygame.font.SysFont('Comic Sans MS', 20)
         self.price_level_font = pygame.font.SysFont('Comic Sans MS', 15)
+        self.profile_font = pygame.font.SysFont('Courier New', 15)
+        #The help text never changes, so it is rendered once
+        self.help_surfaces = [self.font.render(line, 1, self.bear_candle_colour) for line in HELPLINES]
         self.start_time = datetime.datetime.now()
         self.screen_width, self.screen_height = pygame.display.get_surface().get_size()
         self.first_run = True
         self.showing_help = False
-        self.trade_state = TradeState()
-        self.stats = Stats()
-        self.history = list()
         self.show_history = True
+        self.clock = pygame.time.Clock()
+        self.price_lines_surface = None
+        self.price_lines_key = None
+        self.candle_surface = None
+        self.candle_surface_key = None
+        self.candle_surface_last = 0
+        self.drawn_state = None
+        self.drawn_loading_text = None
+        self.help_rect = None
+        self.profiler = FrameProfiler(trace_file=profile_file)
+        self.show_profile = False
+        self.profile_text = ()
+        self.load_data()
         self.readConfig()
 
     def load_data(self):
         """
-        Reads the data from the files
-        """
-        def get_filename(file_list, file_search):
-            for filename in file_list:
-                if file_search in filename.lower():
-                    return filename
-
-        filenames = glob.glob(os.path.join('.', self.data_dir, "*"))
-        if len(filenames) > 0:
-            hourly_file = get_filename(filenames, 'hourly')
-            four_hourly_file = get_filename(filenames, '4 hours')
-            daily_file = get_filename(filenames, 'daily')
-            with open(hourly_file) as ask_file:
-                self.ask = ask_file.readlines()
-            tick_file = get_filename(filenames, 'tick')
-            # if tick_file:
-            #     with open(tick_file) as tick_data:
-            #         self.tick = tick_data.readlines()
-            # print('loaded')
-        self.bid = self.ask
+        Starts reading the data files on a background thread, poll_loader picks them up as they arrive
+        """
+        self.loader = DataLoader(self.data_dir)
+        #Completely loaded timeframes, filled in by the loader
+        self.timeframes = self.loader.timeframes
+        #Timeframe and candle after the last switch, with the exact base candle it was switched from
+        self.switched_position = None
+        self.switched_base_candle = 0
+        #Trades, history and the saved position are always kept in candles of the base timeframe
+        self.base_timeframe = None
+        self.timeframe = None
+        self.loader.start()
+
+    def poll_loader(self):
+        """
+        Takes the base timeframe series from the loader, they may still be growing
+        """
+        if self.loader.base is not None and self.timeframe in (None, self.loader.base_timeframe):
+            self.base_timeframe = self.timeframe = self.loader.base_timeframe
+            self.ask, self.bid = self.loader.base
+
+    def data_ready(self):
+        """
+        True once the candles up to last_candle are loaded
+        """
+        if self.bid is None:
+            return False
+        if self.ask.complete and self.bid.complete:
+            return len(self.bid) > 0
+        return len(self.ask) > self.last_candle and len(self.bid) > self.last_candle
+
+    def loading_text(self):
+        if self.loader.error:
+            return self.loader.error + ". Press Escape to exit."
+        if not self.loader.finished:
+            return "{0}: {1:.0%}".format(self.loader.status, self.loader.progress)
+        return ""
+
+    def draw_loading(self):
+        """
+        Progress screen shown until the candles needed for the chart are loaded
+        """
+        text = self.loading_text()
+        if text == self.drawn_loading_text:
+            return
+        self.screen.fill(self.background_colour)
+        loading_text = render_text(self.font, text, self.bear_candle_colour)
+        self.screen.blit(loading_text, (20, 20))
+        pygame.draw.rect(self.screen, self.doji_candle_colour, (20, 50, 400, 10), 1)
+        pygame.draw.rect(self.screen, self.bull_candle_colour, (20, 50, int(400 * self.loader.progress), 10))
+        pygame.display.update()
+        self.drawn_loading_text = text
+        self.drawn_state = None
+
+    def map_candle(self, candle, source, target):
+        """
+        The candle of the target timeframe containing the start of a candle of the source timeframe
+        """
+        if source == target:
+            return candle
+        return self.index_map(source, target)[candle]
+
+    def index_map(self, source, target):
+        #Built by the loader between the base timeframe and every other one
+        return self.loader.index_maps[(source, target)]
+
+    def closed_candle(self, candle, source, target):
+        """
+        The last candle of the target timeframe that has closed by the end of a candle of the source timeframe,
+        so a longer timeframe never shows prices from after the current moment
+        """
+        if source == target:
+            return candle
+        index_map = self.index_map(source, target)
+        if candle + 1 >= len(index_map):
+            return len(self.timeframes[target][1]) - 1
+        #The target candle containing the start of the next source candle is still open
+        return max(index_map[candle + 1] - 1, 0)
+
+    def base_candle(self):
+        """
+        The current position in base timeframe candles,
+        exact when the chart hasn't moved since switching away from the base timeframe
+        """
+        if self.timeframe == self.base_timeframe:
+            return self.last_candle
+        if self.switched_position == (self.timeframe, self.last_candle):
+            return self.switched_base_candle
+        return self.record_candle(self.last_candle)
+
+    def set_timeframe(self, timeframe):
+        """
+        Switches the chart and trading to another timeframe at the same point in time
+        """
+        if timeframe == self.timeframe:
+            return
+        base_candle = self.base_candle()
+        self.timeframe = timeframe
+        self.ask, self.bid = self.timeframes[timeframe]
+        self.last_candle = self.closed_candle(base_candle, self.base_timeframe, timeframe)
+        if self.trade_state.trade_mode != TradeMode.CLOSED:
+            #For drawing and checking only, the exact entry stays in entry_base_candle
+            self.trade_state.candle_number = self.map_candle(self.entry_base_candle, self.base_timeframe, timeframe)
+        self.switched_position = (timeframe, self.last_candle)
+        self.switched_base_candle = base_candle
+
+    def entry_record_candle(self):
+        return self.entry_base_candle
+
+    def current_record_candle(self):
+        return self.base_candle()
+
+    def buy(self, trade_type):
+        opening = self.trade_state.trade_mode == TradeMode.CLOSED
+        super().buy(trade_type)
+        if opening:
+            self.entry_base_candle = self.base_candle()
+
+    def sell(self, trade_type):
+        opening = self.trade_state.trade_mode == TradeMode.CLOSED
+        super().sell(trade_type)
+        if opening:
+            self.entry_base_candle = self.base_candle()
+
+    def check_orders(self):
+        #On a longer timeframe the closed bars before the entry, and the bar containing it unless the entry was at its close,
+        #have prices from before the entry
+        if self.trade_state.trade_mode != TradeMode.CLOSED and self.timeframe != self.base_timeframe:
+            entry_bar = self.trade_state.candle_number
+            if self.last_candle < entry_bar or (self.last_candle == entry_bar and
+                    self.closed_candle(self.entry_base_candle, self.base_timeframe, self.timeframe) < entry_bar):
+                return
+        super().check_orders()
+
+    def change_timeframe(self, step):
+        #Only once the current timeframe has finished loading, so the candle maps can be built
+        if self.timeframe not in self.timeframes:
+            return
+        names = [name for name, _ in TIMEFRAMES if name in self.timeframes]
+        index = min(max(names.index(self.timeframe) + step, 0), len(names) - 1)
+        self.set_timeframe(names[index])
+
+    def record_candle(self, candle):
+        if self.timeframe == self.base_timeframe:
+            return candle
+        return self.closed_candle(min(candle, len(self.bid) - 1), self.timeframe, self.base_timeframe)
 
     def draw_chart(self):
         """
         Draws the chart
         """
-        if self.last_candle < self.max_candles:
-            self.last_candle = self.max_candles
-        maxheight = 0
-        minheight = 9999
-        for x in range(0, self.max_candles):
-            offset = self.last_candle-x
-            high = float(self.bid[offset].split(',')[OHLC.HIGHINDEX.value])
-            if high > maxheight:
-                maxheight = high
-            low = float(self.bid[offset].split(',')[OHLC.LOWINDEX.value])
-            if low < minheight:
-                minheight = low
+        self.clamp_last_candle()
+        minheight, maxheight = self.bid.price_range(self.last_candle - self.max_candles + 1, self.last_candle)
         factor = (self.screen_height - CHARTTOPYOFFSET) / self.chart_pip_height * 10000
-        #Draw Price Lines
-        for x in range(0, self.chart_pip_height, 20):
-            val = float("%.3f" % maxheight) - x*0.0001
-            line_ypos = int(self.screen_height - (val-minheight) * factor) - CHARTTOPYOFFSET
-            pygame.draw.line(self.screen, self.doji_candle_colour, (0, line_ypos), (self.screen_width - CHARTRIGHTSPACING - 5, line_ypos), 1)
-            text = self.price_level_font.render(str(val).ljust(7, '0'), 1, (self.bear_candle_colour))
-            self.screen.blit(text, (self.screen_width - CHARTRIGHTSPACING, line_ypos - 13))
-        #Draw Chart Data
-        for x in range(0, self.max_candles):
-            offset = self.last_candle-x
-            xpos = self.candle_spacing + (self.candle_spacing + self.candle_width) * (self.max_candles-x)
-            open_price = float(self.bid[offset].split(',')[OHLC.OPENINDEX.value])
-            high_price = float(self.bid[offset].split(',')[OHLC.HIGHINDEX.value])
-            low_price = float(self.bid[offset].split(',')[OHLC.LOWINDEX.value])
-            close_price = float(self.bid[offset].split(',')[OHLC.CLOSEINDEX.value])
+        #Draw Price Lines and Chart Data from the cached layers
+        self.screen.blit(self.get_price_lines_surface(minheight, maxheight, factor), (0, 0))
+        self.screen.blit(self.get_candle_surface(minheight, factor), (0, 0))
+        #Draw open position and stop loss
+        if (self.trade_state.trade_mode != TradeMode.CLOSED):
+            order_ypos = int(self.screen_height - (self.trade_state.order_price-minheight) * factor) - CHARTTOPYOFFSET
+            stop_ypos = int(self.screen_height - (self.trade_state.stop_loss_price-minheight) * factor) - CHARTTOPYOFFSET
+            draw_horizontal_dashed_line(self.screen, self.order_colour, (0, order_ypos), (self.screen_width - CHARTRIGHTSPACING, order_ypos))
+            draw_horizontal_dashed_line(self.screen, self.stop_loss_colour, (0, stop_ypos), (self.screen_width - CHARTRIGHTSPACING, stop_ypos))
+        #Draw historical trades
+        if self.show_history:
+            history_offset = self.record_candle(max(self.last_candle - self.max_candles, 0))
+            for hist in self.history.closed_between(history_offset, self.record_candle(self.last_candle)):
+                history_open_xpos = self.candle_xpos(self.map_candle(hist[0], self.base_timeframe, self.timeframe))
+                history_open_trade_ypos = int(self.screen_height - (hist[1]-minheight) * factor) - CHARTTOPYOFFSET
+                history_close_xpos = self.candle_xpos(self.map_candle(hist[2], self.base_timeframe, self.timeframe))
+                history_close_trade_ypos = int(self.screen_height - (hist[3]-minheight) * factor) - CHARTTOPYOFFSET
+                history_colour = self.bull_candle_colour if hist[4] == TradeMode.BUY.value else self.bear_candle_colour
+                pygame.draw.line(self.screen, history_colour, (history_open_xpos, history_open_trade_ypos), (history_close_xpos, history_close_trade_ypos), 1)
+
+    def clamp_last_candle(self):
+        #A window with fewer than max_candles candles is drawn from the left edge of the data
+        if self.last_candle >= len(self.bid):
+            self.last_candle = len(self.bid) - 1
+        if self.last_candle < 0:
+            self.last_candle = 0
+
+    def get_price_lines_surface(self, minheight, maxheight, factor):
+        """
+        Background with the price lines and their labels, only redrawn when the scale changes
+        """
+        key = (self.screen_width, self.screen_height, "%.3f" % maxheight, minheight, self.chart_pip_height)
+        if key != self.price_lines_key:
+            if self.price_lines_surface is None or self.price_lines_surface.get_size() != (self.screen_width, self.screen_height):
+                self.price_lines_surface = pygame.Surface((self.screen_width, self.screen_height)).convert()
+            surface = self.price_lines_surface
+            surface.fill(self.background_colour)
+            for x in range(0, self.chart_pip_height, 20):
+                val = float("%.3f" % maxheight) - x*0.0001
+                line_ypos = int(self.screen_height - (val-minheight) * factor) - CHARTTOPYOFFSET
+                pygame.draw.line(surface, self.doji_candle_colour, (0, line_ypos), (self.screen_width - CHARTRIGHTSPACING - 5, line_ypos), 1)
+                text = render_text(self.price_level_font, str(val).ljust(7, '0'), self.bear_candle_colour)
+                surface.blit(text, (self.screen_width - CHARTRIGHTSPACING, line_ypos - 13))
+            self.price_lines_key = key
+        return self.price_lines_surface
+
+    def get_candle_surface(self, minheight, factor):
+        """
+        Transparent layer holding the candles.
+        While the scale is unchanged, moving the chart scrolls the layer and only draws the candles that came into view
+        """
+        key = (self.screen_width, self.screen_height, minheight, factor, self.max_candles, self.candle_width, self.candle_spacing, id(self.bid))
+        if self.candles_per_pixel > 1:
+            #Envelopes are grouped from the last candle so every move redraws them
+            key += (self.last_candle,)
+        step = self.candle_spacing + self.candle_width
+        move = self.last_candle - self.candle_surface_last
+        if key != self.candle_surface_key or abs(move) >= self.max_candles:
+            if self.candle_surface is None or self.candle_surface.get_size() != (self.screen_width, self.screen_height):
+                self.candle_surface = pygame.Surface((self.screen_width, self.screen_height)).convert()
+                self.candle_surface.set_colorkey(self.background_colour)
+            self.candle_surface_key = key
+            if self.candles_per_pixel > 1:
+                self.draw_envelopes(minheight, factor)
+            else:
+                self.draw_candles(0, self.screen_width, minheight, factor)
+        elif move != 0:
+            self.candle_surface.scroll(-move * step, 0)
+            #Clear what scrolled out of view at either end and draw what came into view
+            first_candle = self.last_candle - self.max_candles + 1
+            if move > 0:
+                left_edge = self.candle_xpos(first_candle)
+                right_edge = self.candle_xpos(self.last_candle - move + 1)
+            else:
+                left_edge = self.candle_xpos(self.candle_surface_last - self.max_candles + 1)
+                right_edge = self.candle_xpos(self.last_candle + 1)
+            self.draw_candles(0, left_edge + self.candle_width + 1, minheight, factor)
+            self.draw_candles(right_edge, self.screen_width, minheight, factor)
+        self.candle_surface_last = self.last_candle
+        return self.candle_surface
+
+    def candle_xpos(self, candle):
+        return self.candle_spacing + (self.candle_spacing + self.candle_width) * ((self.max_candles - (self.last_candle - candle)) // self.candles_per_pixel)
+
+    def draw_envelopes(self, minheight, factor):
+        """
+        Level of detail drawing for when there are more candles than pixels,
+        each column shows the low to high range of its group of candles
+        """
+        surface = self.candle_surface
+        surface.fill(self.background_colour)
+        first_visible = self.last_candle - self.max_candles + 1
+        for first in range(max(first_visible, 0), self.last_candle + 1, self.candles_per_pixel):
+            last = min(first + self.candles_per_pixel - 1, self.last_candle)
+            low_price, high_price = self.bid.price_range(first, last)
+            open_price = self.bid.open[first]
+            close_price = self.bid.close[last]
+            xpos = self.candle_xpos(first)
+            candle_high_ypos = int(self.screen_height - (high_price-minheight) * factor) - CHARTTOPYOFFSET
+            candle_low_ypos = int(self.screen_height - (low_price-minheight) * factor) - CHARTTOPYOFFSET
+            if close_price > open_price:
+                colour = self.bull_candle_colour
+            elif close_price < open_price:
+                colour = self.bear_candle_colour
+            else:
+                colour = self.doji_candle_colour
+            pygame.draw.line(surface, colour, (xpos, candle_high_ypos), (xpos, candle_low_ypos), 1)
+
+    def draw_candles(self, left, right, minheight, factor):
+        """
+        Redraws the columns left..right of the candle layer, oldest candle first
+        """
+        surface = self.candle_surface
+        area = pygame.Rect(left, 0, right - left, self.screen_height)
+        surface.fill(self.background_colour, area)
+        surface.set_clip(area)
+        step = self.candle_spacing + self.candle_width
+        first_visible = self.last_candle - self.max_candles + 1
+        first = max(first_visible, (left - self.candle_spacing - self.candle_width) // step + first_visible - 1, 0)
+        last = min(self.last_candle, (right - self.candle_spacing) // step + first_visible - 1)
+        for offset in range(first, last + 1):
+            xpos = self.candle_xpos(offset)
+            open_price = self.bid.open[offset]
+            high_price = self.bid.high[offset]
+            low_price = self.bid.low[offset]
+            close_price = self.bid.close[offset]
             candle_open_ypos = int(self.screen_height - (open_price-minheight) * factor) - CHARTTOPYOFFSET
             candle_high_ypos = int(self.screen_height - (high_price-minheight) * factor) - CHARTTOPYOFFSET
             candle_low_ypos = int(self.screen_height - (low_price-minheight) * factor) - CHARTTOPYOFFSET
             candle_close_ypos = int(self.screen_height - (close_price-minheight) * factor) - CHARTTOPYOFFSET
             candle_close_distance = int(abs(open_price-close_price) * factor)
             if candle_open_ypos < candle_close_ypos:
-                pygame.draw.rect(self.screen, self.bear_candle_colour, (xpos, candle_open_ypos, self.candle_width, candle_close_distance))
+                pygame.draw.rect(surface, self.bear_candle_colour, (xpos, candle_open_ypos, self.candle_width, candle_close_distance))
                 #Draw Candle Wick
-                pygame.draw.line(self.screen, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_high_ypos), (xpos+int(self.candle_width/2), candle_open_ypos), 1)
-                pygame.draw.line(self.screen, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_low_ypos), (xpos+int(self.candle_width/2), candle_close_ypos), 1)
+                pygame.draw.line(surface, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_high_ypos), (xpos+int(self.candle_width/2), candle_open_ypos), 1)
+                pygame.draw.line(surface, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_low_ypos), (xpos+int(self.candle_width/2), candle_close_ypos), 1)
             elif candle_open_ypos > candle_close_ypos:
-                pygame.draw.rect(self.screen, self.bull_candle_colour, (xpos, candle_close_ypos, self.candle_width, candle_close_distance))
+                pygame.draw.rect(surface, self.bull_candle_colour, (xpos, candle_close_ypos, self.candle_width, candle_close_distance))
                 #Draw Candle Wick
-                pygame.draw.line(self.screen, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_high_ypos), (xpos+int(self.candle_width/2), candle_close_ypos), 1)
-                pygame.draw.line(self.screen, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_low_ypos), (xpos+int(self.candle_width/2), candle_open_ypos), 1)
+                pygame.draw.line(surface, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_high_ypos), (xpos+int(self.candle_width/2), candle_close_ypos), 1)
+                pygame.draw.line(surface, self.doji_candle_colour, (xpos+int(self.candle_width/2), candle_low_ypos), (xpos+int(self.candle_width/2), candle_open_ypos), 1)
             #Draw Candle Body
-            pygame.draw.line(self.screen, self.doji_candle_colour, (xpos, candle_open_ypos), (xpos+self.candle_width, candle_open_ypos), 1)
-            pygame.draw.line(self.screen, self.doji_candle_colour, (xpos+self.candle_width, candle_open_ypos), (xpos+self.candle_width, candle_close_ypos), 1)
-            pygame.draw.line(self.screen, self.doji_candle_colour, (xpos, candle_close_ypos), (xpos+self.candle_width, candle_close_ypos), 1)
-            pygame.draw.line(self.screen, self.doji_candle_colour, (xpos, candle_open_ypos), (xpos, candle_close_ypos), 1)
-        #Draw open position and stop loss
-        if (self.trade_state.trade_mode != TradeMode.CLOSED):
-            order_ypos = int(self.screen_height - (self.trade_state.order_price-minheight) * factor) - CHARTTOPYOFFSET
-            stop_ypos = int(self.screen_height - (self.trade_state.stop_loss_price-minheight) * factor) - CHARTTOPYOFFSET
-            draw_horizontal_dashed_line(self.screen, self.order_colour, (0, order_ypos), (self.screen_width - CHARTRIGHTSPACING, order_ypos))
-            draw_horizontal_dashed_line(self.screen, self.stop_loss_colour, (0, stop_ypos), (self.screen_width - CHARTRIGHTSPACING, stop_ypos))
-        #Draw historical trades
-        if self.show_history:
-            history_offset = self.last_candle - self.max_candles
-            for hist in self.history:
-                if int(hist[2]) >= history_offset and int(hist[2]) <= self.last_candle:
-                    history_open_xpos = self.candle_spacing + (self.candle_spacing + self.candle_width) * (self.max_candles - (self.last_candle - int(hist[0])))
-                    history_open_trade_ypos = int(self.screen_height - (float(hist[1])-minheight) * factor) - CHARTTOPYOFFSET
-                    history_close_xpos = self.candle_spacing + (self.candle_spacing + self.candle_width) * (self.max_candles - (self.last_candle - int(hist[2])))
-                    history_close_trade_ypos = int(self.screen_height - (float(hist[3])-minheight) * factor) - CHARTTOPYOFFSET
-                    history_colour = self.bull_candle_colour if int(hist[4]) == TradeMode.BUY.value else self.bear_candle_colour
-                    pygame.draw.line(self.screen, history_colour, (history_open_xpos, history_open_trade_ypos), (history_close_xpos, history_close_trade_ypos), 1)
+            pygame.draw.line(surface, self.doji_candle_colour, (xpos, candle_open_ypos), (xpos+self.candle_width, candle_open_ypos), 1)
+            pygame.draw.line(surface, self.doji_candle_colour, (xpos+self.candle_width, candle_open_ypos), (xpos+self.candle_width, candle_close_ypos), 1)
+            pygame.draw.line(surface, self.doji_candle_colour, (xpos, candle_close_ypos), (xpos+self.candle_width, candle_close_ypos), 1)
+            pygame.draw.line(surface, self.doji_candle_colour, (xpos, candle_open_ypos), (xpos, candle_close_ypos), 1)
+        surface.set_clip(None)
+
+    def view_state(self):
+        """
+        Everything that changes what is drawn, the overlays last so they can be redrawn on their own
+        """
+        return (self.screen_width, self.screen_height, self.timeframe, self.last_candle, self.max_candles, self.candle_width,
+                self.candle_spacing, self.chart_pip_height, self.show_history, len(self.history),
+                self.trade_state.trade_mode, self.trade_state.equity, self.trade_state.profit, self.loading_text(),
+                self.profile_text, self.showing_help)
+
+    def draw_frame(self, state):
+        """
+        Draws the chart, info text and help, then updates only the part of the display that changed
+        """
+        dirty_rect = self.screen.get_rect()
+        if self.drawn_state is not None and state[:-2] == self.drawn_state[:-2]:
+            overlay_rects = [rect for rect, changed in ((self.profile_rect(), state[-2] != self.drawn_state[-2]),
+                                                        (self.help_rect, state[-1] != self.drawn_state[-1])) if changed]
+            if overlay_rects and None not in overlay_rects:
+                dirty_rect = overlay_rects[0].unionall(overlay_rects[1:])
+        profiler = self.profiler
+        self.screen.set_clip(dirty_rect)
+        with profiler.stage('draw_chart'):
+            self.draw_chart()
+        with profiler.stage('draw_info_text'):
+            self.draw_info_text()
+        if self.showing_help:
+            with profiler.stage('displayHelp'):
+                self.displayHelp()
+        if self.show_profile:
+            self.draw_profile()
+        self.screen.set_clip(None)
+        with profiler.stage('display_update'):
+            pygame.display.update(dirty_rect)
+        self.drawn_state = self.view_state()
+
+    def profile_rect(self):
+        """
+        Fixed area of the frame timings overlay, so it covers whatever was drawn there before
+        """
+        height = self.profile_font.get_linesize() * (len(self.profiler.stages) + 1) + 10
+        return pygame.Rect(self.screen_width - 420, 10, 400, height)
+
+    def draw_profile(self):
+        rect = self.profile_rect()
+        self.screen.fill(self.background_colour, rect)
+        line_height = self.profile_font.get_linesize()
+        for index, line in enumerate(self.profile_text):
+            line_text = render_text(self.profile_font, line, self.doji_candle_colour)
+            self.screen.blit(line_text, (rect.x + 5, rect.y + 5 + index * line_height))
 
     def main_loop(self):
         """
         The loop that runs the app
         """
+        profiler = self.profiler
         try:
             while not self.done:
-                self.do_events()
-                self.screen.fill((45, 45, 45))
-                self.check_orders()
-                self.draw_info_text()
-                if self.showing_help:
-                    self.displayHelp()
-                self.draw_chart()
-                pygame.display.flip()
+                profiler.start_frame()
+                self.poll_loader()
+                with profiler.stage('do_events'):
+                    self.do_events()
+                if self.data_ready():
+                    with profiler.stage('check_orders'):
+                        self.check_orders()
+                    if self.show_profile and profiler.frame_number % PROFILEREFRESHFRAMES == 0:
+                        self.profile_text = tuple(profiler.summary_lines())
+                    state = self.view_state()
+                    if state != self.drawn_state:
+                        self.draw_frame(state)
+                else:
+                    self.draw_loading()
+                self.journal.sync_if_due()
+                profiler.end_frame()
+                self.clock.tick(MAXFPS)
                 self.first_run = False
         except:
             print("Unexpected error:", sys.exc_info())
-
-    def check_orders(self):
-        if (self.trade_state.trade_mode == TradeMode.BUY):
-            self.trade_state.pips = 1 + (float(self.bid[self.last_candle].split(',')[OHLC.CLOSEINDEX.value]) - self.trade_state.order_price) * 10000
-            self.trade_state.profit = self.trade_state.pips * self.trade_state.position_size * 100
-            if float(self.bid[self.last_candle].split(',')[OHLC.LOWINDEX.value]) <= self.trade_state.stop_loss_price:
-                self.close(self.trade_state.trade_type, self.trade_state.stop_loss_price)
-
-        if (self.trade_state.trade_mode == TradeMode.SELL):
-            self.trade_state.pips = 1 + (self.trade_state.order_price - float(self.ask[self.last_candle].split(',')[OHLC.CLOSEINDEX.value])) * 10000 
-            self.trade_state.profit = self.trade_state.pips * self.trade_state.position_size * 100
-            if float(self.ask[self.last_candle].split(',')[OHLC.HIGHINDEX.value]) >= self.trade_state.stop_loss_price:
-                self.close(self.trade_state.trade_type, self.trade_state.stop_loss_price)
+        finally:
+            self.journal.close()
+            profiler.close()
 
     def draw_info_text(self):
-        last_candle_data_text = self.font.render(self.bid[self.last_candle], 1, (self.bear_candle_colour))
+        last_candle_data_text = render_text(self.font, self.timeframe + " " + self.bid.describe(self.last_candle), self.bear_candle_colour)
         self.screen.blit(last_candle_data_text, (20, 20))
-        equity_text = self.font.render("Pre-Trade Balance: " + str("%.2f" % (self.trade_state.equity)), 1, (self.bear_candle_colour))
+        equity_text = render_text(self.font, "Pre-Trade Balance: " + str("%.2f" % (self.trade_state.equity)), self.bear_candle_colour)
         self.screen.blit(equity_text, (20, 45))
-        equity_text = self.font.render("Equity: " + str("%.2f" % (self.trade_state.equity + self.trade_state.profit)), 1, (self.bear_candle_colour))
+        equity_text = render_text(self.font, "Equity: " + str("%.2f" % (self.trade_state.equity + self.trade_state.profit)), self.bear_candle_colour)
         self.screen.blit(equity_text, (20, 70))
-        profit_text = self.font.render("Profit: " + str("%.2f" % self.trade_state.profit), 1, (self.bear_candle_colour))
+        profit_text = render_text(self.font, "Profit: " + str("%.2f" % self.trade_state.profit), self.bear_candle_colour)
         self.screen.blit(profit_text, (20, 95))
-        trade_mode_text = self.font.render("Trade Mode: " + str(self.trade_state.trade_mode.name), 1, (self.bear_candle_colour))
+        trade_mode_text = render_text(self.font, "Trade Mode: " + str(self.trade_state.trade_mode.name), self.bear_candle_colour)
         self.screen.blit(trade_mode_text, (20, 120))
-        pips_text = self.font.render("Pips: " + str("%.1f" % self.trade_state.pips), 1, (self.bear_candle_colour))
+        pips_text = render_text(self.font, "Pips: " + str("%.1f" % self.trade_state.pips), self.bear_candle_colour)
         self.screen.blit(pips_text, (20, 145))
-        position_size_text = self.font.render("Position Size: " + str("%.4f" % self.trade_state.position_size), 1, (self.bear_candle_colour))
+        position_size_text = render_text(self.font, "Position Size: " + str("%.4f" % self.trade_state.position_size), self.bear_candle_colour)
         self.screen.blit(position_size_text, (20, 170))
-        help_text = self.font.render("Press F1 to toggle help info ", 1, (self.bear_candle_colour))
+        help_text = render_text(self.font, "Press F1 to toggle help info ", self.bear_candle_colour)
         self.screen.blit(help_text, (20, 195))
-
-    def buy(self, trade_type):
-        if self.trade_state.trade_mode == TradeMode.CLOSED:
-            self.trade_state.trade_mode = TradeMode.BUY
-            self.trade_state.order_price = float(self.ask[self.last_candle].split(',')[OHLC.CLOSEINDEX.value])
-            self.trade_state.stop_loss_price = self.trade_state.order_price - TRADERISKPIPS * 0.0001
-            self.trade_state.position_size = self.trade_state.equity * TRADERISKPERCENT / TRADERISKPIPS * 0.01
-            self.trade_state.candle_number = self.last_candle
-            self.trade_state.trade_type = trade_type
-
-    def sell(self, trade_type):
-        if self.trade_state.trade_mode == TradeMode.CLOSED:
-            self.trade_state.trade_mode = TradeMode.SELL
-            self.trade_state.order_price = float(self.bid[self.last_candle].split(',')[OHLC.CLOSEINDEX.value])
-            self.trade_state.stop_loss_price = self.trade_state.order_price + TRADERISKPIPS * 0.0001
-            self.trade_state.position_size = self.trade_state.equity * TRADERISKPERCENT / TRADERISKPIPS * 0.01
-            self.trade_state.candle_number = self.last_candle
-            self.trade_state.trade_type = trade_type
-
-    def close(self, trade_type, close_price=None):
-        if self.trade_state.trade_mode != TradeMode.CLOSED:
-            self.history.append([
-                self.trade_state.candle_number,
-                self.trade_state.order_price,
-                self.last_candle,
-                close_price or self.ask[self.last_candle].split(',')[OHLC.CLOSEINDEX.value],
-                self.trade_state.trade_mode.value
-            ])
-            self.trade_state.trade_mode = TradeMode.CLOSED
-            self.trade_state.equity += self.trade_state.profit
-            if trade_type == TradeType.FADE:
-                self.stats.fade.append(self.trade_state.pips)
-            else:
-                self.stats.trend.append(self.trade_state.pips)
-            self.trade_state.profit = 0
-            self.trade_state.order_price = 0
-            self.trade_state.position_size = 0
-            self.trade_state.stop_loss_price = 0
-            self.trade_state.pips = 0
+        for index, trade_type in enumerate((TradeType.TREND, TradeType.FADE)):
+            running = self.stats.running[trade_type]
+            stats_text = render_text(self.font, "{0}: {1} trades, Win {2:.0f}%, Exp {3:.1f}, Med {4:.1f}, PF {5:.2f}, DD {6:.1f}".format(
+                trade_type.name.title(), running.count, running.win_rate * 100, running.expectancy,
+                running.median if running.count else 0, running.profit_factor, running.max_drawdown), self.bear_candle_colour)
+            self.screen.blit(stats_text, (20, 220 + index * 25))
+        if self.loading_text():
+            loading_text = render_text(self.font, self.loading_text(), self.bear_candle_colour)
+            self.screen.blit(loading_text, (20, 270))
 
     def do_events(self):
         """
         Query for quit and keypress events
         """
         events = pygame.event.get(pump=True)
+        ready = self.data_ready()
         for event in events:
+            if not ready and event.type in (pygame.KEYDOWN, pygame.MOUSEMOTION) and getattr(event, 'key', None) != pygame.K_ESCAPE:
+                continue
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     self.writeConfig()
@@ -266,14 +543,10 @@ class Trading():
                     self.chart_pip_height-=20
                 if event.key == pygame.K_LEFT:
                     self.last_candle -= 1
-                    if self.last_candle < self.max_candles:
-                        self.last_candle = self.max_candles
                 if event.key == pygame.K_RIGHT:
                     self.last_candle += 1
                 if event.key == pygame.K_PAGEDOWN:
                     self.last_candle -= 5
-                    if self.last_candle < self.max_candles:
-                        self.last_candle = self.max_candles
                 if event.key == pygame.K_PAGEUP:
                     self.last_candle += 5
                 if event.key == pygame.K_h:
@@ -290,22 +563,38 @@ class Trading():
                     self.close(self.trade_state.trade_type)
                 if event.key == pygame.K_F1:
                     self.showing_help = not self.showing_help
+                if event.key == pygame.K_F2:
+                    self.show_profile = not self.show_profile
+                    self.profile_text = tuple(self.profiler.summary_lines()) if self.show_profile else ()
                 if event.key == pygame.K_1:
                     self.max_candles = 450
                     self.candle_width = 3
                     self.candle_spacing = 1
+                    self.candles_per_pixel = 1
                 if event.key == pygame.K_2:
                     self.max_candles = 600
                     self.candle_width = 2 
                     self.candle_spacing = 1
+                    self.candles_per_pixel = 1
                 if event.key == pygame.K_3:
                     self.max_candles = 900
                     self.candle_width = 1
                     self.candle_spacing = 1
+                    self.candles_per_pixel = 1
                 if event.key == pygame.K_4:
                     self.max_candles = 1800
                     self.candle_width = 1
                     self.candle_spacing = 0
+                    self.candles_per_pixel = 1
+                if event.key == pygame.K_5:
+                    self.max_candles = 7200
+                    self.candle_width = 1
+                    self.candle_spacing = 0
+                    self.candles_per_pixel = 4
+                if event.key == pygame.K_PERIOD:
+                    self.change_timeframe(1)
+                if event.key == pygame.K_COMMA:
+                    self.change_timeframe(-1)
             if event.type == pygame.MOUSEMOTION and pygame.mouse.get_pressed()[0]:
                 rel = pygame.mouse.get_rel()[0]
                 move=0
@@ -314,71 +603,119 @@ class Trading():
                 elif rel < 0:
                     move = +15 
                 self.last_candle += move
+            if event.type == pygame.VIDEORESIZE:
+                self.screen_width, self.screen_height = self.screen.get_size()
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.drawn_state = None
             if event.type is QUIT:
                 self.writeConfig()
                 self.done = True
+        if ready:
+            self.clamp_last_candle()
 
     def displayHelp(self):
-        text1 = "Move 1 candle: use left and right arrow."
-        text2 = "Move multiple candles: use PageUp and PageDown."
-        text3 = "Buy/Sell. Tracked as Fade Trade: b/s."
-        text4 = "Buy/Sell. Tracked as Trend Trade: n/d."
-        text5 = "Change Zoom: 1-4."
-        text6 = "Exit: Escape."
-        text1_text = self.font.render(text1, 1, (self.bear_candle_colour))
-        text2_text = self.font.render(text2, 1, (self.bear_candle_colour))
-        text3_text = self.font.render(text3, 1, (self.bear_candle_colour))
-        text4_text = self.font.render(text4, 1, (self.bear_candle_colour))
-        text5_text = self.font.render(text5, 1, (self.bear_candle_colour))
-        text6_text = self.font.render(text6, 1, (self.bear_candle_colour))
-        self.screen.blit(text1_text, (700, 60))
-        self.screen.blit(text2_text, (700, 85))
-        self.screen.blit(text3_text, (700, 110))
-        self.screen.blit(text4_text, (700, 135))
-        self.screen.blit(text5_text, (700, 160))
-        self.screen.blit(text6_text, (700, 185))
-    
+        self.help_rect = self.screen.blit(self.help_surfaces[0], (700, 60)).unionall(
+            [self.screen.blit(surface, (700, 60 + index * 25)) for index, surface in enumerate(self.help_surfaces[1:], 1)])
+
+    def close(self, trade_type, close_price=None):
+        pips = self.trade_state.pips
+        record = super().close(trade_type, close_price)
+        if record is not None:
+            self.journal_sequence += 1
+            self.journal.append(self.journal_sequence, *record, trade_type.value, pips, self.trade_state.equity)
+            self.journal_records += 1
+        return record
+
+    def read_snapshot_file(self, filename):
+        """
+        The journal sequence a snapshot file includes and its lines.
+        A missing file or one written before the sequence was stored in it includes no journal records,
+        the journal was emptied whenever those were written
+        """
+        if not os.path.exists(filename):
+            return 0, []
+        with open(filename) as snapshot_file:
+            data = snapshot_file.readlines()
+        if data and data[0].startswith("#"):
+            return int(data[0][1:]), data[1:]
+        return 0, data
+
     def readConfig(self):
+        config_sequence = 0
         if os.path.exists(self.config_file):
             with open(self.config_file) as config_file:
                 data = config_file.readlines()
-                if len(data) == 2:
+                if len(data) >= 2:
                     self.trade_state.equity = float(data[0].rstrip())
                     self.last_candle = int(data[1].rstrip())
-            if os.path.exists(self.fade_file):
-                with open(self.fade_file) as config_file:
-                    data = config_file.readlines()
-                    for x in data:
-                        x = x.rstrip()
-                        if x != "":
-                            self.stats.fade.append(x)
-            if os.path.exists(self.trend_file):
-                with open(self.trend_file) as config_file:
-                    data = config_file.readlines()
-                    for x in data:
-                        x = x.rstrip()
-                        if x != "":
-                            self.stats.trend.append(x)
-            if os.path.exists(self.history_file):
-                with open(self.history_file) as config_file:
-                    data = config_file.readlines()
-                    self.history = list(x.rstrip().split() for x in data if x != "")
+                if len(data) >= 3:
+                    config_sequence = int(data[2].rstrip())
+        fade_sequence, data = self.read_snapshot_file(self.fade_file)
+        for x in data:
+            x = x.rstrip()
+            if x != "":
+                self.stats.add(TradeType.FADE, x)
+        trend_sequence, data = self.read_snapshot_file(self.trend_file)
+        for x in data:
+            x = x.rstrip()
+            if x != "":
+                self.stats.add(TradeType.TREND, x)
+        history_sequence, data = self.read_snapshot_file(self.history_file)
+        for x in data:
+            x = x.split()
+            if len(x) == 5:
+                self.history.append(int(x[0]), float(x[1]), int(x[2]), float(x[3]), int(x[4]))
+        self.journal_sequence = max(config_sequence, fade_sequence, trend_sequence, history_sequence)
+        #Trades closed since each file above was written
+        stats_sequences = {TradeType.FADE: fade_sequence, TradeType.TREND: trend_sequence}
+        for record in self.journal.read():
+            sequence, open_candle, order_price, close_candle, close_price, mode, trade_type, pips, equity = record
+            self.journal_records += 1
+            self.journal_sequence = max(self.journal_sequence, sequence)
+            if sequence > history_sequence:
+                self.history.append(open_candle, order_price, close_candle, close_price, mode)
+            if sequence > stats_sequences[TradeType(trade_type)]:
+                self.stats.add(TradeType(trade_type), pips)
+            if sequence > config_sequence:
+                self.trade_state.equity = equity
+                self.last_candle = close_candle
+
+    def write_snapshot_file(self, filename, lines, header=True):
+        """
+        Replaces a snapshot file in one step, headed by the journal sequence it includes
+        """
+        temp_file = filename + '.tmp'
+        with open(temp_file, "w") as snapshot_file:
+            if header:
+                snapshot_file.write("#" + str(self.journal_sequence) + "\n")
+            snapshot_file.writelines(lines)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        os.replace(temp_file, filename)
 
     def writeConfig(self):
-        with open(self.config_file, "w") as config_file:
-            config_file.write(str(self.trade_state.equity)+"\n")
-            config_file.write(str(self.last_candle)+"\n")
-        with open(self.fade_file, "w") as fade_file:
-            for x in self.stats.fade:
-                fade_file.write(str("%.1f" % float(x))+"\n")
-        with open(self.trend_file, "w") as trend_file:
-            for x in self.stats.trend:
-                trend_file.write(str("%.1f" % float(x))+"\n")
-        with open(self.history_file, "w") as history_file:
-            for x in self.history:
-                history_file.write("{0} {1} {2} {3} {4}\n".format(x[0], x[1], x[2], x[3], x[4]))
+        """
+        Saves the position and equity. The closed trades stay in the journal until it holds COMPACTRECORDS of them,
+        then they are written to the fade, trend and history files and the journal is emptied
+        """
+        if self.journal_records >= COMPACTRECORDS:
+            self.write_snapshot_file(self.fade_file, [str("%.1f" % float(x))+"\n" for x in self.stats.fade])
+            self.write_snapshot_file(self.trend_file, [str("%.1f" % float(x))+"\n" for x in self.stats.trend])
+            self.write_snapshot_file(self.history_file, ["{0} {1} {2} {3} {4}\n".format(x[0], x[1], x[2], x[3], x[4])
+                                                         for x in self.history])
+        self.write_snapshot_file(self.config_file, [str(self.trade_state.equity)+"\n",
+                                                    str(self.base_candle())+"\n",
+                                                    str(self.journal_sequence)+"\n"], header=False)
+        if self.journal_records >= COMPACTRECORDS:
+            #Every file now includes the journal's trades
+            self.journal.clear()
+            self.journal_records = 0
 
 
 if __name__ == "__main__":
-    app = Trading()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help="write the timings of every frame to FILE, CSV or a Chrome trace if it ends with .json")
+    args = parser.parse_args()
+    app = Trading(args.profile)
     app.main_loop()
@@ -0,0 +1,121 @@
+"""
+Per stage timings of the main loop, kept over a rolling window of frames
+"""
+
+import csv
+import json
+import os
+import time
+from array import array
+from contextlib import contextmanager
+
+
+#Frames kept for the percentiles, 10 seconds at 60 fps
+WINDOW = 600
+PERCENTILES = (50, 95, 99)
+STAGES = ('do_events', 'check_orders', 'draw_chart', 'draw_info_text', 'displayHelp', 'display_update', 'frame')
+
+
+class StageTimer:
+    """
+    The last WINDOW durations (seconds) of one stage in a ring buffer
+    """
+    def __init__(self, window=WINDOW):
+        self.samples = array('d', [0.0]) * window
+        self.count = 0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+
+    def percentiles(self, percentiles=PERCENTILES):
+        """
+        Nearest rank percentiles of the window, None before the first sample
+        """
+        size = min(self.count, len(self.samples))
+        if size == 0:
+            return [None for _ in percentiles]
+        ordered = sorted(self.samples[:size])
+        return [ordered[min(size - 1, (size * percentile + 99) // 100 - 1)] for percentile in percentiles]
+
+
+class FrameProfiler:
+    """
+    Times the stages of each frame with time.perf_counter.
+    A stage that doesn't run in a frame (eg nothing needed drawing) adds no sample.
+    If trace_file is given every frame is also written to it, as CSV rows of milliseconds,
+    or as Chrome trace events (chrome://tracing, Perfetto) when the name ends with .json
+    """
+    def __init__(self, stages=STAGES, trace_file=None):
+        self.stages = stages
+        self.timers = {stage: StageTimer() for stage in stages}
+        self.frame_number = 0
+        self.frame_stages = dict()
+        self.start_time = time.perf_counter()
+        self.frame_start = self.start_time
+        self.trace_file = None
+        self.trace_writer = None
+        if trace_file:
+            self.trace_file = open(trace_file, 'w', newline='')
+            if trace_file.endswith('.json'):
+                #The closing ] is optional in the trace event format, so a killed session is still readable
+                self.trace_file.write('[\n')
+            else:
+                self.trace_writer = csv.writer(self.trace_file)
+                self.trace_writer.writerow(('frame', 'start_ms') + tuple(stage + '_ms' for stage in stages))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def add(self, name, start, end):
+        self.timers[name].add(end - start)
+        #A stage can run more than once in a frame
+        previous = self.frame_stages.get(name)
+        self.frame_stages[name] = (previous[0] if previous else start, (previous[1] if previous else 0.0) + end - start)
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+        self.frame_stages = dict()
+
+    def end_frame(self):
+        """
+        Records the frame total (excluding the wait for the frame rate) and writes the trace
+        """
+        if 'frame' in self.timers:
+            self.add('frame', self.frame_start, time.perf_counter())
+        if self.trace_file is not None:
+            if self.trace_writer is not None:
+                self.trace_writer.writerow([self.frame_number, "%.3f" % ((self.frame_start - self.start_time) * 1000)] +
+                                           ["%.3f" % (self.frame_stages[stage][1] * 1000) if stage in self.frame_stages else ""
+                                            for stage in self.stages])
+            else:
+                for stage, (start, seconds) in self.frame_stages.items():
+                    self.trace_file.write(json.dumps({'name': stage, 'ph': 'X', 'pid': os.getpid(), 'tid': 0,
+                                                      'ts': round((start - self.start_time) * 1e6, 1),
+                                                      'dur': round(seconds * 1e6, 1),
+                                                      'args': {'frame': self.frame_number}}) + ',\n')
+        self.frame_number += 1
+
+    def summary(self):
+        """
+        [(stage, [p50, p95, p99 in milliseconds or None]), ...]
+        """
+        return [(stage, [None if value is None else value * 1000 for value in self.timers[stage].percentiles()])
+                for stage in self.stages]
+
+    def summary_lines(self):
+        lines = ["{0:<15}{1:>8}{2:>8}{3:>8}".format('ms', *('p{0}'.format(percentile) for percentile in PERCENTILES))]
+        for stage, values in self.summary():
+            lines.append("{0:<15}".format(stage) + "".join("{0:>8}".format("-" if value is None else "%.2f" % value)
+                                                          for value in values))
+        return lines
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
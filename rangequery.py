@@ -0,0 +1,145 @@
+"""
+Range queries over price columns
+"""
+
+from array import array
+
+
+#Values summarised by each leaf of a BlockTree
+BLOCKSIZE = 32
+
+class SegmentTree:
+    """
+    Answers func(values[first..last]) in O(log n), func being min or max.
+    Built once in O(n), the leaves are padded to a power of two with identity
+    """
+    def __init__(self, values, func, identity):
+        self.func = func
+        self.identity = identity
+        self.length = len(values)
+        self.size = 1
+        while self.size < self.length:
+            self.size *= 2
+        tree = array('d', [identity]) * (2 * self.size)
+        tree[self.size:self.size + self.length] = array('d', values)
+        for index in range(self.size - 1, 0, -1):
+            tree[index] = func(tree[2 * index], tree[2 * index + 1])
+        self.tree = tree
+
+    def first_reaching(self, start, threshold):
+        """
+        First index >= start whose value reaches threshold, that is value <= threshold
+        for a min tree and value >= threshold for a max tree. -1 if there isn't one
+        """
+        if start < 0:
+            start = 0
+        if start >= self.length:
+            return -1
+        tree = self.tree
+        below = self.func is min
+        node = start + self.size
+        #Climb right until a node's range contains a match
+        while not (tree[node] <= threshold if below else tree[node] >= threshold):
+            while node & 1:
+                node >>= 1
+            if node == 0:
+                return -1
+            node += 1
+        #Then descend to its leftmost matching leaf
+        while node < self.size:
+            node *= 2
+            if not (tree[node] <= threshold if below else tree[node] >= threshold):
+                node += 1
+        return node - self.size
+
+    def __len__(self):
+        return self.length
+
+    def query(self, first, last):
+        """
+        func over values[first..last], both ends included
+        """
+        func = self.func
+        tree = self.tree
+        result = self.identity
+        first = max(first, 0) + self.size
+        last = min(last, self.length - 1) + self.size + 1
+        while first < last:
+            if first & 1:
+                result = func(result, tree[first])
+                first += 1
+            if last & 1:
+                last -= 1
+                result = func(result, tree[last])
+            first >>= 1
+            last >>= 1
+        return result
+
+
+class BlockTree:
+    """
+    Same queries as SegmentTree without copying the values: the tree only holds func of each
+    block of BLOCKSIZE values and the partial blocks at the ends of a query are read from values itself,
+    so a memory mapped column isn't pulled into memory
+    """
+    def __init__(self, values, func, identity, block_size=BLOCKSIZE):
+        self.values = values
+        self.func = func
+        self.identity = identity
+        self.block_size = block_size
+        self.length = len(values)
+        self.blocks = SegmentTree(array('d', (func(values[start:start + block_size])
+                                             for start in range(0, self.length, block_size))), func, identity)
+
+    def __len__(self):
+        return self.length
+
+    def _scan(self, first, last):
+        #func over values[first:last], identity if empty
+        if first >= last:
+            return self.identity
+        return self.func(self.values[first:last])
+
+    def query(self, first, last):
+        """
+        func over values[first..last], both ends included
+        """
+        first = max(first, 0)
+        last = min(last, self.length - 1)
+        if first > last:
+            return self.identity
+        size = self.block_size
+        first_block = first // size
+        last_block = last // size
+        if first_block == last_block:
+            return self._scan(first, last + 1)
+        result = self.func(self._scan(first, (first_block + 1) * size), self._scan(last_block * size, last + 1))
+        return self.func(result, self.blocks.query(first_block + 1, last_block - 1))
+
+    def first_reaching(self, start, threshold):
+        """
+        First index >= start whose value reaches threshold, that is value <= threshold
+        for a min tree and value >= threshold for a max tree. -1 if there isn't one
+        """
+        start = max(start, 0)
+        if start >= self.length:
+            return -1
+        values = self.values
+        below = self.func is min
+        size = self.block_size
+        block = start // size
+        while True:
+            for index in range(start, min((block + 1) * size, self.length)):
+                if (values[index] <= threshold if below else values[index] >= threshold):
+                    return index
+            block = self.blocks.first_reaching(block + 1, threshold)
+            if block == -1:
+                return -1
+            start = block * size
+
+
+def max_tree(values):
+    return BlockTree(values, max, float('-inf'))
+
+def min_tree(values):
+    return BlockTree(values, min, float('inf'))
@@ -0,0 +1,134 @@
+"""
+Builds candle series for several timeframes from a tick data file in a single pass
+"""
+
+import math
+from series import PriceSeries, CACHE_SUFFIX, CHUNK_BYTES, parse_timestamp, read_cache, read_chunks, write_cache
+
+
+#Name and length in seconds, each timeframe must divide evenly into the next
+TIMEFRAMES = (('1m', 60), ('5m', 300), ('1h', 3600), ('4h', 14400), ('daily', 86400))
+
+
+class BarBuilder:
+    """
+    Aggregates prices into bars of a single timeframe.
+    Finished bars are appended to the series and passed on to the next (coarser) builder
+    """
+    def __init__(self, seconds, parent=None, series=None):
+        self.seconds = seconds
+        self.parent = parent
+        self.series = PriceSeries() if series is None else series
+        self.start = None
+        self.open = self.high = self.low = self.close = 0
+
+    def add(self, time, open_price, high_price, low_price, close_price):
+        start = time - time % self.seconds
+        if start == self.start:
+            if high_price > self.high:
+                self.high = high_price
+            if low_price < self.low:
+                self.low = low_price
+            self.close = close_price
+        else:
+            self.flush()
+            self.start = start
+            self.open = open_price
+            self.high = high_price
+            self.low = low_price
+            self.close = close_price
+
+    def flush(self):
+        if self.start is not None:
+            self.series.append(self.start, self.open, self.high, self.low, self.close)
+            if self.parent:
+                self.parent.add(self.start, self.open, self.high, self.low, self.close)
+            self.start = None
+
+    def finish(self):
+        self.flush()
+        if self.parent:
+            self.parent.finish()
+
+
+def _build_chain(timeframes, series):
+    builders = list()
+    parent = None
+    for name, seconds in reversed(timeframes):
+        parent = BarBuilder(seconds, parent, series.get(name))
+        builders.insert(0, parent)
+    return builders
+
+def resample_ticks(filename, timeframes=TIMEFRAMES, chunk_bytes=CHUNK_BYTES, progress=None, series=None):
+    """
+    Streams a tick file (Time,Ask,Bid,AskVolume,BidVolume, where Time may be split
+    into date and time columns) and returns {timeframe name: (ask series, bid series)}.
+    Only chunk_bytes of the file are held in memory at once,
+    progress(fraction of the file read) is called after every chunk.
+    Bars are appended to the (ask, bid) series given in series by timeframe name,
+    so another thread can use them while they grow, they are marked complete at the end
+    """
+    series = series or dict()
+    ask_builders = _build_chain(timeframes, {name: prices[0] for name, prices in series.items()})
+    bid_builders = _build_chain(timeframes, {name: prices[1] for name, prices in series.items()})
+    add_ask = ask_builders[0].add
+    add_bid = bid_builders[0].add
+    for lines, fraction in read_chunks(filename, chunk_bytes):
+        for line in lines:
+            fields = line.split(',')
+            if len(fields) >= 6:
+                time_text = fields[0] + ' ' + fields[1]
+                fields = fields[1:]
+            elif len(fields) == 5:
+                time_text = fields[0]
+            else:
+                continue
+            try:
+                ask = float(fields[1])
+                bid = float(fields[2])
+            except ValueError:
+                #Header or damaged line
+                continue
+            time = parse_timestamp(time_text)
+            if math.isnan(time):
+                continue
+            add_ask(time, ask, ask, ask, ask)
+            add_bid(time, bid, bid, bid, bid)
+        if progress:
+            progress(fraction)
+    ask_builders[0].finish()
+    bid_builders[0].finish()
+    for builder in ask_builders + bid_builders:
+        builder.series.complete = True
+    return {name: (ask_builder.series, bid_builder.series)
+            for (name, _), ask_builder, bid_builder in zip(timeframes, ask_builders, bid_builders)}
+
+def tick_cache_filenames(filename, name):
+    return (filename + '.' + name + '.ask' + CACHE_SUFFIX,
+            filename + '.' + name + '.bid' + CACHE_SUFFIX)
+
+def load_tick_timeframes(filename, timeframes=TIMEFRAMES, progress=None, series=None):
+    """
+    Same as resample_ticks but memory maps the cached bars when they were built
+    from the current version of the tick file, series is then left empty
+    """
+    result = dict()
+    for name, _ in timeframes:
+        ask_cache, bid_cache = tick_cache_filenames(filename, name)
+        ask = read_cache(ask_cache, filename)
+        bid = read_cache(bid_cache, filename)
+        if ask is None or bid is None:
+            break
+        result[name] = (ask, bid)
+    else:
+        return result
+    result = resample_ticks(filename, timeframes, progress=progress, series=series)
+    try:
+        for name, (ask, bid) in result.items():
+            ask_cache, bid_cache = tick_cache_filenames(filename, name)
+            write_cache(ask, ask_cache, filename)
+            write_cache(bid, bid_cache, filename)
+    except OSError:
+        #Read only data directory, keep working from the resampled data
+        pass
+    return result
@@ -0,0 +1,270 @@
+"""
+Columnar candle storage for the chart and order logic
+"""
+
+import datetime
+import functools
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from enums import OHLC
+from rangequery import max_tree, min_tree
+
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_EPOCH = datetime.datetime(1970, 1, 1)
+CACHE_SUFFIX = '.ohlc'
+#magic (with byte order of the float columns), source size, source mtime, rows
+_CACHE_MAGIC = b'TPOHLC1' + (b'L' if sys.byteorder == 'little' else b'B')
+_CACHE_HEADER = struct.Struct('<8sQqQ')
+CHUNK_BYTES = 1 << 20
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(text):
+    parts = text.replace('-', '.').replace('/', '.').split('.')
+    if len(parts[0]) == 4:
+        year, month, day = parts
+    else:
+        day, month, year = parts
+    return (datetime.date(int(year), int(month), int(day)).toordinal() - _EPOCH_ORDINAL) * 86400
+
+def parse_timestamp(text):
+    """
+    Converts a data file timestamp (eg 2020.01.01 22:02:56.165 or 01.01.2020 22:00:00.000)
+    into seconds since the epoch, or nan if it can't be read
+    """
+    date_text, _, time_text = text.strip().partition(' ')
+    try:
+        seconds = _parse_date(date_text)
+        if time_text:
+            hms = time_text.split(':')
+            seconds += int(hms[0]) * 3600 + int(hms[1]) * 60
+            if len(hms) > 2:
+                seconds += float(hms[2])
+        return float(seconds)
+    except (ValueError, IndexError):
+        return math.nan
+
+def format_timestamp(seconds):
+    if math.isnan(seconds):
+        return ""
+    return (_EPOCH + datetime.timedelta(seconds=seconds)).strftime('%Y.%m.%d %H:%M:%S')
+
+
+class PriceSeries:
+    """
+    OHLC candles held as contiguous float columns.
+    columns[0] is the timestamp and columns[OHLC.xINDEX.value] the prices,
+    so the layout matches the fields of the data file lines
+    """
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = [array('d') for _ in range(OHLC.CLOSEINDEX.value + 1)]
+        self.columns = columns
+        self.time = columns[0]
+        self.open = columns[OHLC.OPENINDEX.value]
+        self.high = columns[OHLC.HIGHINDEX.value]
+        self.low = columns[OHLC.LOWINDEX.value]
+        self.close = columns[OHLC.CLOSEINDEX.value]
+        self._high_tree = None
+        self._low_tree = None
+        #False while a loader is still appending candles
+        self.complete = True
+
+    def __len__(self):
+        return len(self.close)
+
+    def append(self, time, open_price, high_price, low_price, close_price):
+        self.time.append(time)
+        self.open.append(open_price)
+        self.high.append(high_price)
+        self.low.append(low_price)
+        self.close.append(close_price)
+
+    @property
+    def high_tree(self):
+        if self._high_tree is None or len(self._high_tree) != len(self):
+            self._high_tree = max_tree(self.high)
+        return self._high_tree
+
+    @property
+    def low_tree(self):
+        if self._low_tree is None or len(self._low_tree) != len(self):
+            self._low_tree = min_tree(self.low)
+        return self._low_tree
+
+    def build_trees(self):
+        """
+        Builds the range query trees ahead of use, eg on a loading thread
+        """
+        return self.high_tree, self.low_tree
+
+    def price_range(self, first, last):
+        """
+        Lowest low and highest high of candles first..last (inclusive)
+        """
+        high_tree, low_tree = self._high_tree, self._low_tree
+        if high_tree is None or low_tree is None or len(high_tree) != len(self) or len(low_tree) != len(self):
+            #Still loading, scan the window rather than build the trees on the drawing thread
+            first = max(first, 0)
+            if first > last:
+                return math.inf, -math.inf
+            return min(self.low[first:last + 1]), max(self.high[first:last + 1])
+        return low_tree.query(first, last), high_tree.query(first, last)
+
+    def describe(self, index):
+        """
+        Text for a single candle in the same layout as the data file
+        """
+        return "{0},{1},{2},{3},{4}".format(
+            format_timestamp(self.time[index]),
+            self.open[index],
+            self.high[index],
+            self.low[index],
+            self.close[index])
+
+
+def read_chunks(filename, chunk_bytes=CHUNK_BYTES):
+    """
+    Reads a text file about chunk_bytes at a time, so only one chunk is held in memory.
+    Yields (lines, fraction of the file read) for each chunk
+    """
+    size = os.path.getsize(filename) or 1
+    #Characters read, tell() isn't available on a text file read by lines
+    read = 0
+    with open(filename) as data_file:
+        while True:
+            lines = data_file.readlines(chunk_bytes)
+            if not lines:
+                break
+            read += sum(map(len, lines))
+            yield lines, min(read / size, 1.0)
+
+def parse_chunks(filename, series):
+    """
+    Parses a candle data file (Time,Open,High,Low,Close[,Volume]) into series a chunk at a time,
+    yielding the fraction of the file read after each chunk, so another thread can use series while it grows
+    """
+    append = series.append
+    for lines, fraction in read_chunks(filename):
+        for line in lines:
+            fields = line.split(',')
+            if len(fields) <= OHLC.CLOSEINDEX.value:
+                continue
+            try:
+                row = (parse_timestamp(fields[0]),
+                       float(fields[OHLC.OPENINDEX.value]),
+                       float(fields[OHLC.HIGHINDEX.value]),
+                       float(fields[OHLC.LOWINDEX.value]),
+                       float(fields[OHLC.CLOSEINDEX.value]))
+            except ValueError:
+                #Header or damaged line
+                continue
+            append(*row)
+        yield fraction
+    series.complete = True
+
+def parse_series(filename, series=None, progress=None):
+    """
+    Parses a candle data file into a PriceSeries, appending to series if one is given.
+    progress(fraction of the file read) is called after every chunk
+    """
+    if series is None:
+        series = PriceSeries()
+    for fraction in parse_chunks(filename, series):
+        if progress:
+            progress(fraction)
+    return series
+
+def cache_filename(filename):
+    return filename + CACHE_SUFFIX
+
+def write_cache(series, cache_file, source_file):
+    """
+    Stores the series next to its source as a header followed by one float64 block per column
+    """
+    stat = os.stat(source_file)
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'wb') as cache:
+        cache.write(_CACHE_HEADER.pack(_CACHE_MAGIC, stat.st_size, stat.st_mtime_ns, len(series)))
+        for column in series.columns:
+            array('d', column).tofile(cache)
+    os.replace(temp_file, cache_file)
+
+def read_cache(cache_file, source_file):
+    """
+    Memory maps a cache written by write_cache.
+    Returns None if it is missing or was built from a different version of the source file
+    """
+    if not os.path.exists(cache_file):
+        return None
+    stat = os.stat(source_file)
+    with open(cache_file, 'rb') as cache:
+        header = cache.read(_CACHE_HEADER.size)
+        if len(header) != _CACHE_HEADER.size:
+            return None
+        magic, size, mtime, rows = _CACHE_HEADER.unpack(header)
+        if magic != _CACHE_MAGIC or size != stat.st_size or mtime != stat.st_mtime_ns:
+            return None
+        column_bytes = rows * 8
+        if os.fstat(cache.fileno()).st_size != _CACHE_HEADER.size + column_bytes * (OHLC.CLOSEINDEX.value + 1):
+            return None
+        mapping = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapping)
+    columns = list()
+    for index in range(OHLC.CLOSEINDEX.value + 1):
+        start = _CACHE_HEADER.size + index * column_bytes
+        columns.append(view[start:start + column_bytes].cast('d'))
+    return PriceSeries(columns)
+
+def load_series_steps(filename, series=None):
+    """
+    Loads a candle data file, memory mapping its binary cache when it is up to date
+    and parsing the file (then writing the cache) when it isn't.
+    A generator yielding the fraction parsed after each chunk and returning the series,
+    so several files can be parsed in step
+    """
+    cache_file = cache_filename(filename)
+    cached = read_cache(cache_file, filename)
+    if cached is not None:
+        return cached
+    if series is None:
+        series = PriceSeries()
+    yield from parse_chunks(filename, series)
+    try:
+        write_cache(series, cache_file, filename)
+    except OSError:
+        #Read only data directory, keep working from the parsed data
+        pass
+    return series
+
+def load_series(filename, series=None, progress=None):
+    """
+    load_series_steps run to the end, calling progress(fraction parsed) after every chunk
+    """
+    steps = load_series_steps(filename, series)
+    while True:
+        try:
+            fraction = next(steps)
+        except StopIteration as finished:
+            return finished.value
+        if progress:
+            progress(fraction)
+
+def containing_candles(times, target_times):
+    """
+    For each timestamp in times, the index of the target candle containing it
+    (the last one starting at or before it, 0 if it is before them all).
+    Both columns are in time order so each search starts from the previous result
+    """
+    result = array('q', [0]) * len(times)
+    target = 0
+    for index, time in enumerate(times):
+        target = max(bisect_right(target_times, time, target) - 1, 0)
+        result[index] = target
+    return result
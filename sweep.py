@@ -0,0 +1,112 @@
+"""
+Runs a backtest strategy over a grid of risk settings and timeframes on every CPU core
+"""
+
+import argparse
+import csv
+import importlib
+import itertools
+import multiprocessing
+from backtest import run_backtest
+from engine import TRADERISKPIPS, TRADERISKPERCENT
+from enums import TradeType
+from loader import load_timeframes
+
+
+RESULT_FIELDS = ('timeframe', 'risk_pips', 'risk_percent', 'trades', 'final_equity', 'return_percent',
+                 'max_drawdown_percent',
+                 'trend_trades', 'trend_win_rate', 'trend_expectancy', 'trend_median_pips', 'trend_profit_factor',
+                 'fade_trades', 'fade_win_rate', 'fade_expectancy', 'fade_median_pips', 'fade_profit_factor')
+
+#Per worker process state, set by _init_worker
+_worker_data_dir = None
+_worker_strategy = None
+_worker_timeframes = dict()
+
+
+def _init_worker(data_dir, strategy):
+    global _worker_data_dir, _worker_strategy
+    _worker_data_dir = data_dir
+    _worker_strategy = strategy
+
+def _worker_series(timeframe):
+    #Memory maps the cache files, so every worker shares the same pages instead of a pickled copy
+    if timeframe not in _worker_timeframes:
+        _worker_timeframes.update(load_timeframes(_worker_data_dir, (timeframe,)))
+    return _worker_timeframes[timeframe]
+
+def summarise(backtest, timeframe):
+    """
+    One results table row for a finished Backtest
+    """
+    peak = backtest.equity_curve[0]
+    max_drawdown = 0
+    for equity in backtest.equity_curve:
+        peak = max(peak, equity)
+        max_drawdown = max(max_drawdown, (peak - equity) / peak)
+    starting_equity = backtest.equity_curve[0]
+    row = dict(timeframe=timeframe,
+               risk_pips=backtest.risk_pips,
+               risk_percent=backtest.risk_percent,
+               trades=len(backtest.history),
+               final_equity=backtest.trade_state.equity,
+               return_percent=(backtest.trade_state.equity - starting_equity) / starting_equity * 100,
+               max_drawdown_percent=max_drawdown * 100)
+    for prefix, trade_type in (('trend', TradeType.TREND), ('fade', TradeType.FADE)):
+        running = backtest.stats.running[trade_type]
+        row[prefix + '_trades'] = running.count
+        row[prefix + '_win_rate'] = running.win_rate
+        row[prefix + '_expectancy'] = running.expectancy
+        row[prefix + '_median_pips'] = running.median
+        row[prefix + '_profit_factor'] = running.profit_factor
+    return row
+
+def _run_configuration(configuration):
+    timeframe, risk_pips, risk_percent = configuration
+    ask, bid = _worker_series(timeframe)
+    backtest = run_backtest(ask, bid, _worker_strategy, risk_pips, risk_percent)
+    return summarise(backtest, timeframe)
+
+def run_sweep(data_dir, strategy, risk_pips=(TRADERISKPIPS,), risk_percents=(TRADERISKPERCENT,), timeframes=('1h',), processes=None):
+    """
+    Backtests strategy for every combination of risk_pips, risk_percents and timeframes
+    in a pool of processes and returns one summary row per combination.
+    strategy is a Backtest.run callback or signal list and has to be picklable (a module level function).
+    Raises ValueError if a timeframe has neither a candle file nor tick data to resample
+    """
+    #Build any missing caches once up front so the workers only ever memory map them
+    available = load_timeframes(data_dir, timeframes)
+    missing = [name for name in timeframes if name not in available]
+    if missing:
+        raise ValueError("No data for timeframes {0} in {1}".format(", ".join(missing), data_dir))
+    configurations = list(itertools.product(timeframes, risk_pips, risk_percents))
+    with multiprocessing.Pool(processes, _init_worker, (data_dir, strategy)) as pool:
+        results = list(pool.imap_unordered(_run_configuration, configurations))
+    results.sort(key=lambda row: (row['timeframe'], row['risk_pips'], row['risk_percent']))
+    return results
+
+def write_results(results, filename):
+    with open(filename, 'w', newline='') as results_file:
+        writer = csv.DictWriter(results_file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('strategy', help="strategy function as module:function")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--risk-pips', type=float, nargs='+', default=[TRADERISKPIPS])
+    parser.add_argument('--risk-percent', type=float, nargs='+', default=[TRADERISKPERCENT])
+    parser.add_argument('--timeframes', nargs='+', default=['1h'])
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', default='sweep.csv')
+    args = parser.parse_args()
+    module_name, _, function_name = args.strategy.partition(':')
+    strategy = getattr(importlib.import_module(module_name), function_name)
+    try:
+        results = run_sweep(args.data_dir, strategy, args.risk_pips, args.risk_percent, args.timeframes, args.processes)
+    except ValueError as error:
+        parser.error(str(error))
+    write_results(results, args.output)
+    print("Wrote", len(results), "results to", args.output)
@@ -0,0 +1,153 @@
+"""
+Running trade statistics, updated in constant time per closed trade
+"""
+
+import math
+from bisect import insort
+
+
+#Quantiles are exact order statistics up to this many values, P-square estimates after
+EXACTCOUNT = 100
+
+
+class P2Quantile:
+    """
+    Streaming estimate of a single quantile with the P-square algorithm (Jain and Chlamtac),
+    five markers are kept however many values are added.
+    The markers need many values to settle, so up to EXACTCOUNT values are also kept sorted and used instead
+    """
+    def __init__(self, quantile):
+        self.quantile = quantile
+        self.count = 0
+        self.ordered = list()
+        self.heights = list()
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * quantile, 1 + 4 * quantile, 3 + 2 * quantile, 5]
+        self.increments = [0, quantile / 2, quantile, (1 + quantile) / 2, 1]
+
+    def add(self, value):
+        self.count += 1
+        if self.ordered is not None:
+            if self.count <= EXACTCOUNT:
+                insort(self.ordered, value)
+            else:
+                self.ordered = None
+        heights = self.heights
+        if len(heights) < 5:
+            heights.append(value)
+            heights.sort()
+            return
+        positions = self.positions
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+        for index in range(cell + 1, 5):
+            positions[index] += 1
+        for index in range(5):
+            self.desired[index] += self.increments[index]
+        #Move the middle markers towards their desired positions
+        for index in range(1, 4):
+            offset = self.desired[index] - positions[index]
+            if (offset >= 1 and positions[index + 1] - positions[index] > 1) or (offset <= -1 and positions[index - 1] - positions[index] < -1):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(index, step)
+                if not heights[index - 1] < height < heights[index + 1]:
+                    height = heights[index] + step * (heights[index + step] - heights[index]) / (positions[index + step] - positions[index])
+                heights[index] = height
+                positions[index] += step
+
+    def _parabolic(self, index, step):
+        heights = self.heights
+        positions = self.positions
+        return heights[index] + step / (positions[index + 1] - positions[index - 1]) * (
+            (positions[index] - positions[index - 1] + step) * (heights[index + 1] - heights[index]) / (positions[index + 1] - positions[index]) +
+            (positions[index + 1] - positions[index] - step) * (heights[index] - heights[index - 1]) / (positions[index] - positions[index - 1]))
+
+    def value(self):
+        if self.count == 0:
+            return math.nan
+        if self.ordered is not None:
+            #Linear interpolation between the closest ranks
+            position = self.quantile * (len(self.ordered) - 1)
+            lower = math.floor(position)
+            upper = min(lower + 1, len(self.ordered) - 1)
+            return self.ordered[lower] + (self.ordered[upper] - self.ordered[lower]) * (position - lower)
+        return self.heights[2]
+
+
+class RunningStats:
+    """
+    Pip statistics for one kind of trade
+    """
+    QUANTILES = (0.05, 0.5, 0.95)
+
+    def __init__(self):
+        self.count = 0
+        self.wins = 0
+        self.mean = 0.0
+        self.sum_squares = 0.0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.total = 0.0
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        self.streak = 0
+        self.max_win_streak = 0
+        self.max_loss_streak = 0
+        self.quantiles = {quantile: P2Quantile(quantile) for quantile in self.QUANTILES}
+
+    def add(self, pips):
+        self.count += 1
+        #Welford's update for the mean and variance
+        delta = pips - self.mean
+        self.mean += delta / self.count
+        self.sum_squares += delta * (pips - self.mean)
+        if pips > 0:
+            self.wins += 1
+            self.gross_profit += pips
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.max_win_streak = max(self.max_win_streak, self.streak)
+        else:
+            self.gross_loss -= pips
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.max_loss_streak = max(self.max_loss_streak, -self.streak)
+        self.total += pips
+        self.peak = max(self.peak, self.total)
+        self.max_drawdown = max(self.max_drawdown, self.peak - self.total)
+        for estimate in self.quantiles.values():
+            estimate.add(pips)
+
+    @property
+    def win_rate(self):
+        return self.wins / self.count if self.count else 0.0
+
+    @property
+    def variance(self):
+        return self.sum_squares / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def expectancy(self):
+        """
+        Average pips per trade, ie win rate * average win - loss rate * average loss
+        """
+        return self.mean
+
+    @property
+    def profit_factor(self):
+        if self.gross_loss == 0:
+            return math.inf if self.gross_profit > 0 else 0.0
+        return self.gross_profit / self.gross_loss
+
+    @property
+    def median(self):
+        return self.quantiles[0.5].value()
+
+    def quantile(self, quantile):
+        return self.quantiles[quantile].value()